@@ -0,0 +1,159 @@
+"""Checks that blocks render without allocating, as the audio thread
+must: allocations can wait on the allocator or set off the garbage
+collector, and a late block is heard as a click.
+
+Blocks are rendered like the stream callback does, through a
+Player.Bufferer, while tracemalloc watches. CPython makes small
+objects like ints and array views for any Python code, from pools of
+its own, and NumPy some bookkeeping for each call, so a few bytes are
+let through. BufferPlayers alone, like interval training plays, take
+about 600 bytes a block, and are held to PLAYER_ALLOWANCE, under a
+mono block of the smallest size. Mixes also make FFTs for the
+reverb and reductions for the limiter, whose bookkeeping is about
+1.5 kB a call whatever the size, and take up to about 3 kB a block.
+They are held to ALLOWANCE, under a stereo block of the smallest
+size.
+
+Rendering allocates when it has to fall back on render_block, like
+sources without a vectorized render_at do. Live and frozen voices,
+BufferPlayers, mixing and the effects don't. Sources grow their
+work arrays to the block size when a RenderPlan is first used, so
+warmup needs to cover the first block of each size."""
+
+import math
+import tracemalloc
+
+import audio
+import instruments
+import presets
+import reference
+import settings
+
+ALLOWANCE = 3584  # bytes
+PLAYER_ALLOWANCE = 1024
+MIN_CHUNKSIZE = 256  # a mono block of float64 is twice PLAYER_ALLOWANCE
+INTERACTIVE_CHUNKSIZES = settings.latency_profiles["interactive"][:2]
+
+
+class AllocationError(Exception):
+    pass
+
+
+def allocated_while(render) -> int:
+    """Most bytes allocated at once while calling render"""
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    return peak - before
+
+
+def check(
+    source,
+    chunksize=settings.chunksize,
+    blocks=32,
+    warmup=8,
+    allowance=ALLOWANCE,
+):
+    """Raise AllocationError if rendering any of blocks from source
+    allocates more than allowance bytes, after warmup blocks for
+    buffers to grow to size"""
+    if chunksize < MIN_CHUNKSIZE:
+        raise ValueError(f"Blocks under {MIN_CHUNKSIZE} frames are too small to check")
+    bufferer = audio.Player.Bufferer(audio.Player.SourceCombiner([source]), chunksize)
+    duration = chunksize / settings.samplerate
+    for i in range(warmup):
+        bufferer.render(i * duration)
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for i in range(warmup, warmup + blocks):
+            allocated = allocated_while(lambda: bufferer.render(i * duration))
+            if allocated > allowance:
+                raise AllocationError(
+                    f"Block {i} of {source} allocated {allocated} bytes"
+                )
+        kept, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    if kept - start > allowance:
+        raise AllocationError(
+            f"{source} kept {kept - start} bytes over {blocks} blocks"
+        )
+
+
+def frozen_voices() -> audio.SyncedVoices:
+    """Voices frozen in place"""
+    voices = []
+    for pitch, pan in ((69, -0.5), (76, 0.5)):
+        synth = audio.ADSR(instruments.Harmonics([1, 0.5, 0.25]), release_len=0.3)
+        notes = [audio.PitchedNote(0, 1, pitch), audio.PitchedNote(2, 1.5, pitch + 5)]
+        voices.append(audio.Voice(synth, notes, 4, 120, pitched=True, pan=pan))
+    # with the reverb taking the smallest blocks checked
+    synced_voices = reference.mixed(voices, 120, MIN_CHUNKSIZE)
+    segment = synced_voices.tempo_map.constant_segment(0, math.inf)
+    for voice in voices:
+        # synchronously, unlike LoopFreezer
+        voice.frozen = audio.FrozenLoop(voice, voice.notes, segment)
+        voice.freeze = True
+    return synced_voices
+
+
+def live_voices() -> audio.SyncedVoices:
+    """Synthesizers, drums and samples rendered live, with short
+    notes and a tempo ramp for many note changes"""
+    sources = [
+        instruments.Harmonics([1, 0.5, 0.25]),
+        instruments.Sine(),
+        instruments.Square(amplitude=0.3),
+        instruments.Saw(amplitude=0.3),
+    ]
+    voices = []
+    for i, source in enumerate(sources):
+        synth = audio.ADSR(source, attack_len=0.01, decay_len=0.05, sustain_amp=0.7)
+        notes = [audio.PitchedNote(beat / 4, 0.2, 60 + i + beat) for beat in range(8)]
+        voices.append(audio.Voice(synth, notes, 2, 120, pitched=True, pan=i / 4))
+    drums = [
+        instruments.BassDrum(),
+        instruments.SnareDrum(),
+        instruments.HiHatDrum(),
+        instruments.RoundRobin(presets.list_files("snare")),
+    ]
+    for i, drum in enumerate(drums):
+        rhythm = [audio.Note(beat / 2, 0.25) for beat in range(i % 2, 4, 2)]
+        voices.append(audio.Voice(audio.ADSR(drum), rhythm, 2, 120))
+    # with the reverb taking the smallest blocks checked
+    synced_voices = reference.mixed(voices, 120, MIN_CHUNKSIZE)
+    synced_voices.ramp_bpm(150, 4)
+    return synced_voices
+
+
+def played_note() -> audio.BufferPlayer:
+    """What interval training's AudioHandler plays through its Player,
+    its only source: a BufferPlayer, playing a note rendered like
+    those of its NoteCache, or of notes missing from it"""
+    synth = audio.ADSR(
+        instruments.Harmonics([1 / (x + 1) for x in range(10)]),
+        attack_len=0.01,
+        decay_len=2,
+        sustain_amp=0.5,
+        note_length=1,
+    )
+    player = audio.BufferPlayer()
+    player.play(audio.NoteCache.render(synth, 69))
+    return player
+
+
+def check_all():
+    """Check live and frozen voices at settings.chunksize and the block
+    sizes of the interactive latency profile, and a played note at
+    those too, like interval training"""
+    for chunksize in (settings.chunksize, *INTERACTIVE_CHUNKSIZES):
+        for source in (live_voices(), frozen_voices()):
+            check(source, chunksize)
+        check(played_note(), chunksize, allowance=PLAYER_ALLOWANCE)
+
+
+if __name__ == "__main__":
+    check_all()
+    print("No allocations")
@@ -1,10 +1,41 @@
-import pyaudio
+import bisect
+import collections
+import copy
+import fractions
+import math
+import queue
+import threading
+import time
+
 import numpy as np
 
+import backends
 import settings
 import notes
 
 
+class CommandQueue:
+    """Hands changes from the GUI thread to the audio thread.
+    Commands run at the start of the next block, so the audio
+    thread never renders a half-applied change. deque.append
+    and deque.popleft are atomic, so neither side locks."""
+
+    def __init__(self):
+        self._commands = collections.deque()
+
+    def post(self, command, *args):
+        self._commands.append((command, args))
+
+    def flush(self):
+        while self._commands:
+            command, args = self._commands.popleft()
+            try:
+                command(*args)
+            except Exception as e:
+                # raising here would stop the audio stream
+                print(f"Warning: {command} failed on the audio thread: {e}")
+
+
 def powerlerp(
     start_t: float,
     end_t: float,
@@ -21,12 +52,14 @@ def powerlerp(
 
 
 class Player:
-    """PyAudio wrapper for objects with next()"""
+    """Plays sources through an output backend, by default
+    the audio device through PyAudio"""
 
     class SourceCombiner:
 
         def __init__(self, sources: list):
             self._sources = Player.SourceCombiner.arrayify(sources)
+            self._scratch = np.zeros((settings.chunksize, 2))
 
         def __next__(self):
             total = 0
@@ -34,6 +67,34 @@ class Player:
                 total += next(source)
             return total
 
+        def next_block(self, frames: int) -> np.ndarray:
+            blocks = [source.next_block(frames) for source in self._sources]
+            if any(block.ndim == 2 for block in blocks):
+                blocks = [as_stereo(block) for block in blocks]
+            return sum(blocks)
+
+        def next_into(self, out: np.ndarray):
+            """Like next_block, summing stereo frames into out"""
+            frames = len(out)
+            if len(self._scratch) < frames:
+                self._scratch = np.zeros((frames, 2))
+            out.fill(0)
+            for source in self._sources:
+                if source.stereo:
+                    scratch = self._scratch[:frames]
+                    source.next_into(scratch)
+                    out += scratch
+                    continue
+                # a column at a time, as broadcasting over frames allocates
+                scratch = self._scratch[:frames, 0]
+                source.next_into(scratch)
+                for channel in range(2):
+                    out[:, channel] += scratch
+
+        def begin_block(self, dac_time: float = 0):
+            for source in self._sources:
+                source.begin_block(dac_time)
+
         @staticmethod
         def arrayify(x):
             is_iterable = None
@@ -45,47 +106,242 @@ class Player:
             return x if is_iterable else [x]
 
     class Bufferer:
-        """Wrap single sample generators into
-        pyAudio compatible data"""
-
-        def __init__(self, source, chunksize: int):
+        """Render blocks of a source into float32 frames
+        for the backend, one column per channel"""
+
+        def __init__(
+            self,
+            source,
+            chunksize: int,
+            channels: int = 2,
+            samplerate=settings.samplerate,
+        ):
             self._source = source
             self._chunksize = chunksize
-            self.MIN_LEVEL, self.MAX_LEVEL = -1, 1
-
-        def __next__(self):
-            samples = []
-            for _ in range(self._chunksize):
-                samples.append(
-                    min(max(self.MIN_LEVEL, next(self._source)), self.MAX_LEVEL)
-                )
+            self._channels = channels
+            self._samplerate = samplerate
+            # as arrays, as NumPy converts Python numbers on every call
+            self.MIN_LEVEL, self.MAX_LEVEL = np.array(-1.0), np.array(1.0)
+            self.dac_time = 0  # when the block being rendered will be heard
+            # everything a block is rendered into is allocated up front,
+            # views included
+            self._mix = np.zeros((chunksize, 2))
+            self._mono = np.zeros((chunksize, 1))  # with one channel
+            self._mix_columns = (self._mix[:, 0], self._mix[:, 1])
+            self._mono_column = self._mono[:, 0]
+            self._half = np.array(0.5)
+            self._buffer = np.zeros((chunksize, channels), dtype=np.float32)
+            # render time over block duration, the highest since last reset
+            self.peak_load = 0.0
+            self.heard = 0.0  # seconds of blocks that weren't silent
+            self.underflows = 0
+
+        def __next__(self) -> np.ndarray:
+            self._source.begin_block(self.dac_time)
+            self._source.next_into(self._mix)
+            block = self._mix
+            if self._channels == 1:
+                block = self._mono
+                np.add(*self._mix_columns, out=self._mono_column)
+                np.multiply(self._mono_column, self._half, out=self._mono_column)
+            # like np.clip, which allocates for its checks, and clipping
+            # and converting at once would allocate for the conversion
+            np.maximum(block, self.MIN_LEVEL, out=block)
+            np.minimum(block, self.MAX_LEVEL, out=block)
+            np.copyto(self._buffer, block, casting="same_kind")
+            return self._buffer
+
+        def render(self, dac_time: float, underflow: bool = False) -> np.ndarray:
+            """Called by backend streams for each block"""
+            self.dac_time = dac_time
+            if underflow:
+                self.underflows += 1
+            start = time.perf_counter()
+            samples = next(self)
+            duration = self._chunksize / self._samplerate
+            load = (time.perf_counter() - start) / duration
+            # silence, like a stopped backing track, says nothing of the load
+            if np.count_nonzero(samples):  # max() and min() allocate
+                self.peak_load = max(self.peak_load, load)
+                self.heard += duration
             return samples
 
-        @staticmethod
-        def format_samples(samples):
-            return (np.float32(np.array(samples)).tobytes(), pyaudio.paContinue)
-
-        def callback(self, in_data, frame_count, time_info, status_flags):
-            return self.format_samples(next(self))
-
     def __init__(
         self,
         sources: list,
         samplerate=settings.samplerate,
-        chunksize=settings.chunksize,
+        chunksize: int | None = None,
+        channels=2,
+        profile="playback",
+        backend=None,
     ):
-        self._pyaudio = pyaudio.PyAudio()
+        """profile is a key of settings.latency_profiles. Unless
+        chunksize is given, .retune() adapts it to the render load.
+        backend is from the backends module, PyAudioBackend if None."""
+        self.SAFE_LOAD = 0.5  # of the block duration spent rendering
+        self.SHRINK_AFTER = 5  # seconds heard under SAFE_LOAD / 4 to halve buffers
+        self.backend = backends.PyAudioBackend() if backend is None else backend
+        self.samplerate = samplerate
+        self.channels = channels
+        self.device_samplerate = self.backend.samplerate_for(samplerate, channels)
         self._sources = sources
         self._combined_sources = Player.SourceCombiner(sources)
-        self._bufferer = Player.Bufferer(self._combined_sources, chunksize)
-        self._stream = self._pyaudio.open(
-            format=pyaudio.paFloat32,
-            channels=1,
-            rate=samplerate,
-            output=True,
-            frames_per_buffer=chunksize,
-            stream_callback=self._bufferer.callback,
+
+        self.min_chunksize, initial, self.max_chunksize = settings.latency_profiles[
+            profile
+        ]
+        # offline streams don't underflow, and can't be reopened
+        self.adaptive = chunksize is None and not self.backend.offline
+        self._stream = None
+        self.open_stream(initial if chunksize is None else chunksize)
+
+    def open_stream(self, chunksize: int):
+        """(Re)open the output stream with chunksize frames per buffer"""
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+        self.chunksize = chunksize
+        output = self._combined_sources
+        if self.device_samplerate != self.samplerate:
+            output = Resampler(
+                output,
+                self.samplerate,
+                self.device_samplerate,
+                chunksize,
+                self.channels,
+            )
+        self._bufferer = Player.Bufferer(
+            output, chunksize, self.channels, self.device_samplerate
         )
+        self._stream = self.backend.open(
+            self._bufferer.render, self.device_samplerate, self.channels, chunksize
+        )
+
+    def render(self, seconds: float):
+        """Render seconds of output right away, in whole blocks.
+        Only for offline backends, others render on their own."""
+        self._stream.advance(math.ceil(seconds * self.device_samplerate))
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+
+    def retune(self, idle: bool):
+        """Use the smallest buffer whose blocks render in SAFE_LOAD of
+        their duration. Cheap, call it often. Reopening the stream
+        leaves a gap, so it is only done when idle, with playback
+        stopped or between notes."""
+        if not self.adaptive or not idle:
+            return
+        bufferer = self._bufferer
+        load, heard = bufferer.peak_load, bufferer.heard
+        chunksize = self.chunksize
+        if (load > self.SAFE_LOAD or bufferer.underflows) and (
+            chunksize < self.max_chunksize
+        ):
+            chunksize *= 2
+        # halving more than doubles the load, so only well under
+        # SAFE_LOAD, or it would grow back at the next chance
+        elif (
+            heard >= self.SHRINK_AFTER
+            and load < self.SAFE_LOAD / 4
+            and chunksize > self.min_chunksize
+        ):
+            chunksize //= 2
+        if chunksize != self.chunksize:
+            self.open_stream(chunksize)  # measured anew by the new Bufferer
+        elif heard >= self.SHRINK_AFTER:
+            # so old peaks don't keep it from shrinking forever
+            bufferer.peak_load, bufferer.heard, bufferer.underflows = 0.0, 0.0, 0
+
+    def time(self) -> float:
+        """Stream clock, in the units of block DAC times"""
+        return self._stream.get_time()
+
+    def playing_index(self, source: "Sampleable") -> float:
+        """Sample index of source currently being heard,
+        compensated for output latency"""
+        block_index, dac_time = source.block_timing
+        return max(0, block_index + (self.time() - dac_time) * self.samplerate)
+
+
+class Resampler:
+    """Streaming polyphase resampler for block sources. Renders
+    blocks of chunksize from source as needed and keeps what isn't
+    asked for yet, so the source always sees the same block size."""
+
+    def __init__(
+        self,
+        source,
+        samplerate: int,
+        output_samplerate: int,
+        chunksize: int = settings.chunksize,
+        channels: int = 2,
+        taps_per_phase: int = 16,
+    ):
+        self._source = source
+        self._chunksize = chunksize
+        self._channels = channels
+        divisor = math.gcd(samplerate, output_samplerate)
+        self.up, self.down = output_samplerate // divisor, samplerate // divisor
+        self._taps = taps_per_phase
+
+        # windowed sinc lowpass at the upsampled rate, below both Nyquists
+        length = taps_per_phase * self.up
+        cutoff = 0.45 / max(self.up, self.down)
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8)
+        prototype *= self.up  # upsampling by zero stuffing divides by up
+        # _phases[p, k] weighs input n - k for outputs between inputs at phase p
+        self._phases = prototype.reshape(taps_per_phase, self.up).T.copy()
+
+        self._history = np.zeros((taps_per_phase - 1, channels))
+        self._consumed = 0  # input samples resampled so far
+        self._produced = 0  # output samples
+        self._pending = np.zeros((0, channels))
+        self.dac_time = 0
+        self._output_samplerate = output_samplerate
+
+    def begin_block(self, dac_time: float = 0):
+        self.dac_time = dac_time
+
+    def resample(self, block: np.ndarray) -> np.ndarray:
+        if block.ndim == 1:
+            block = block[:, np.newaxis]
+        block = np.broadcast_to(block, (len(block), self._channels))
+        buffer = np.concatenate((self._history, block))
+        first = self._consumed - len(self._history)  # input index of buffer[0]
+        self._consumed += len(block)
+        self._history = buffer[len(buffer) - len(self._history) :]
+
+        # every output whose newest input has arrived
+        end = (self._consumed * self.up - 1) // self.down + 1
+        positions = np.arange(self._produced, end) * self.down
+        self._produced = end
+        newest = positions // self.up - first
+        windows = buffer[newest[:, np.newaxis] - np.arange(self._taps)]
+        return np.einsum(
+            "ok,okc->oc", self._phases[positions % self.up], windows, optimize=True
+        )
+
+    def next_block(self, frames: int) -> np.ndarray:
+        blocks = [self._pending]
+        available = len(self._pending)
+        while available < frames:
+            # when this block will be heard, after what's already waiting
+            self._source.begin_block(
+                self.dac_time + available / self._output_samplerate
+            )
+            blocks.append(self.resample(self._source.next_block(self._chunksize)))
+            available += len(blocks[-1])
+        output = np.concatenate(blocks)
+        self._pending = output[frames:]
+        return output[:frames]
+
+    def next_into(self, out: np.ndarray):
+        """Like next_block, into stereo frames. Allocates,
+        unlike the sources it resamples."""
+        out[:] = self.next_block(len(out))
 
 
 class Sampleable:
@@ -95,18 +351,265 @@ class Sampleable:
     def __init__(self, samplerate=settings.samplerate):
         self.samplerate = samplerate
         self.sample_index = 0
+        # (first index of the last block, when it is heard), swapped atomically
+        self.block_timing: tuple[int, float] = (0, 0)
+        self.varies = False  # whether rewind() changes the sound, like round robin
+        self.stereo = False  # whether blocks are of shape (frames, 2)
+        self._work: dict[str, np.ndarray] = {}  # see work_array()
 
     def get_sample_at_index(self, index: int):
         raise NotImplementedError
 
+    def parameters(self) -> tuple:
+        """Everything the sound depends on except frequency, as a
+        key for caching renders. Only cacheable sources implement it."""
+        raise NotImplementedError
+
+    def begin_block(self, dac_time: float = 0):
+        """Called by the audio thread before each block is rendered.
+        dac_time is when the block's first sample will be heard."""
+        self.block_timing = (self.sample_index + 1, dac_time)
+
     def __next__(self):
         self.sample_index += 1
         return self.get_sample_at_index(self.sample_index)
 
+    def render_block(self, start: int, frames: int) -> np.ndarray:
+        """Samples at indices start to start + frames. Mono sources
+        return shape (frames,), stereo ones (frames, 2). Override
+        with a vectorized version where possible."""
+        return np.fromiter(
+            map(self.get_sample_at_index, range(start, start + frames)),
+            dtype=np.float64,
+            count=frames,
+        )
+
+    def render_at(self, indices: np.ndarray, out: np.ndarray):
+        """Samples at indices, which may be fractional, into out.
+        Override with a vectorized version where possible."""
+        out[:] = np.fromiter(
+            map(self.get_sample_at_index, indices.tolist()),
+            dtype=np.float64,
+            count=len(indices),
+        )
+
+    def work_array(self, name: str, frames: int, dtype=np.float64) -> np.ndarray:
+        """An array of frames kept for name from block to block, grown
+        to the largest, for render_at and kernels to work in without
+        allocating. Its contents are left from the last use."""
+        array = self._work.get(name)
+        if array is None or len(array) < frames or array.dtype != dtype:
+            array = self._work[name] = np.zeros(frames, dtype)
+        return array[:frames]
+
+    def kernels(self) -> list:
+        """This source as a flat list of functions kernel(indices, out),
+        for a RenderPlan. The first writes samples at indices into out,
+        the others multiply out by what they add, like an envelope.
+        Sources wrapping another add theirs to the other's kernels."""
+        return [self.render_at]
+
+    def render_into(self, out: np.ndarray, start: int):
+        """Like render_block, writing into out, of shape (frames,) or
+        (frames, 2) like the blocks. Sources override it where they can
+        render without allocating, which the audio thread shouldn't."""
+        out[:] = self.render_block(start, len(out))
+
+    def next_block(self, frames: int) -> np.ndarray:
+        """Like next(), for frames samples at once"""
+        block = self.render_block(self.sample_index + 1, frames)
+        self.sample_index += frames
+        return block
+
+    def next_into(self, out: np.ndarray):
+        """Like next_block, writing into out, see render_into"""
+        self.render_into(out, self.sample_index + 1)
+        self.sample_index += len(out)
+
     def rewind(self):
         self.sample_index = 0
 
 
+def as_stereo(block: np.ndarray) -> np.ndarray:
+    if block.ndim == 2:
+        return block
+    return np.repeat(block[:, np.newaxis], 2, axis=1)
+
+
+def apply_effects(effects: list, block: np.ndarray) -> np.ndarray:
+    for effect in effects:
+        block = effect.process(block)
+    return block
+
+
+def apply_effects_into(effects: list, block: np.ndarray):
+    """Like apply_effects, in place"""
+    for effect in effects:
+        effect.process_into(block)
+
+
+class SendBus:
+    """Effects fed by the .sends of channels, like a reverb shared
+    by many voices. Rendered by the MixerBus listing it in .sends,
+    after all the channels sending to it."""
+
+    def __init__(self, effects: list | None = None, gain: float = 1):
+        self.effects = [] if effects is None else effects
+        self.gain = gain
+        self._buffer = np.zeros((settings.chunksize, 2))
+        self._scaled = np.zeros((settings.chunksize, 2))
+
+    def send(self, block: np.ndarray, level: float):
+        frames = len(block)
+        if len(self._buffer) < frames:
+            self._buffer = np.zeros((frames, 2))
+            self._scaled = np.zeros((frames, 2))
+        scaled = np.multiply(block, level, out=self._scaled[:frames])
+        self._buffer[:frames] += scaled
+
+    def mix_into(self, mix: np.ndarray):
+        received = self._buffer[: len(mix)]
+        apply_effects_into(self.effects, received)
+        received *= self.gain
+        mix += received
+        received.fill(0)
+
+
+class Channel:
+    """Mixer strip for one source of a MixerBus. .pan goes from
+    -1 (left) to 1 (right). A MixerBus may be the source of a
+    channel, making it a group bus. .effects are inserted after
+    panning, .sends maps SendBuses to send levels."""
+
+    def __init__(
+        self,
+        source: Sampleable,
+        gain: float = 1,
+        pan: float = 0,
+        mute: bool = False,
+        solo: bool = False,
+    ):
+        self.source = source
+        self.gain = gain
+        self.pan = pan
+        self.mute = mute
+        self.solo = solo
+        self.effects: list = []
+        self.sends: dict[SendBus, float] = {}
+        self._mono = np.zeros(settings.chunksize)
+
+    def pan_gains(self, stereo: bool) -> tuple[float, float]:
+        """(left, right) gains for the current .pan and .gain"""
+        pan = min(max(self.pan, -1), 1)
+        if stereo:
+            # balance, keeping what's already panned in the source
+            gains = (min(1 - pan, 1), min(1 + pan, 1))
+        else:
+            # constant power, scaled so centered sources keep their level
+            angle = (pan + 1) * math.pi / 4
+            gains = (math.sqrt(2) * math.cos(angle), math.sqrt(2) * math.sin(angle))
+        return (self.gain * gains[0], self.gain * gains[1])
+
+    def has_solo(self) -> bool:
+        return self.solo or (
+            isinstance(self.source, MixerBus) and self.source.has_solo()
+        )
+
+    def audible(self, soloing: bool) -> bool:
+        return not self.mute and (not soloing or self.has_solo())
+
+    def render_block(self, start: int, frames: int, soloing: bool) -> np.ndarray:
+        block = np.zeros((frames, 2))
+        self.render_into(block, start, soloing)
+        return block
+
+    def render_into(self, out: np.ndarray, start: int, soloing: bool):
+        """Stereo frames into out, of shape (frames, 2)"""
+        source = self.source
+        if isinstance(source, MixerBus):
+            source.render_into(out, start, soloing)
+        elif source.stereo:
+            source.render_into(out, start)
+        # a column at a time, as broadcasting over frames allocates
+        if source.stereo:
+            for channel, gain in enumerate(self.pan_gains(True)):
+                out[:, channel] *= gain
+        else:
+            if len(self._mono) < len(out):
+                self._mono = np.zeros(len(out))
+            mono = self._mono[: len(out)]
+            source.render_into(mono, start)
+            for channel, gain in enumerate(self.pan_gains(False)):
+                np.multiply(mono, gain, out=out[:, channel])
+        apply_effects_into(self.effects, out)
+        for send, level in self.sends.items():
+            send.send(out, level)
+
+
+class MixerBus(Sampleable):
+    """Sums channels into a stereo block of shape (frames, 2).
+    If any channel is soloed, in this bus or any group bus,
+    only soloed channels are heard. .effects are inserted
+    after the channels and sends are mixed."""
+
+    def __init__(self, channels: list[Channel] | None = None, *args, **kw):
+        super().__init__(*args, **kw)
+        self.stereo = True
+        self.channels = [] if channels is None else channels
+        self.sends: list[SendBus] = []
+        self.effects: list = []
+        self._scratch = np.zeros((settings.chunksize, 2))
+
+    def add(self, channel: Channel) -> Channel:
+        self.channels.append(channel)
+        return channel
+
+    def remove(self, channel: Channel):
+        self.channels.remove(channel)
+
+    def has_solo(self) -> bool:
+        # loops rather than any() and sum(), whose generators allocate
+        # on the audio thread
+        for channel in self.channels:
+            if channel.has_solo():
+                return True
+        return False
+
+    @property
+    def latency(self) -> int:
+        """Samples the output lags behind because of .effects"""
+        latency = 0
+        for effect in self.effects:
+            if effect.enabled:
+                latency += effect.latency
+        return latency
+
+    def render_block(
+        self, start: int, frames: int, soloing: bool | None = None
+    ) -> np.ndarray:
+        mix = np.zeros((frames, 2))
+        self.render_into(mix, start, soloing)
+        return mix
+
+    def render_into(self, out: np.ndarray, start: int, soloing: bool | None = None):
+        if soloing is None:
+            soloing = self.has_solo()
+        frames = len(out)
+        if len(self._scratch) < frames:
+            self._scratch = np.zeros((frames, 2))
+        out.fill(0)
+        for channel in self.channels:
+            if channel.audible(soloing):
+                channel.render_into(self._scratch[:frames], start, soloing)
+                out += self._scratch[:frames]
+        for send in self.sends:
+            send.mix_into(out)
+        apply_effects_into(self.effects, out)
+
+    def get_sample_at_index(self, index: int):
+        return self.render_block(index, 1)[0]
+
+
 class ADSR(Sampleable):
     def __init__(
         self,
@@ -120,7 +623,7 @@ class ADSR(Sampleable):
         release_power: float = 1,
         note_length: float = 1,
         *args,
-        **kw
+        **kw,
     ):
         super().__init__(*args, **kw)
         self.source = source
@@ -179,6 +682,129 @@ class ADSR(Sampleable):
         )
         return envelope
 
+    def envelope_block(self, times: np.ndarray) -> np.ndarray:
+        """Vectorized envelope at times, in seconds"""
+        decay_end = self.attack_len + self.decay_len
+        release_end = self.note_length + self.release_len
+        attack = powerlerp(
+            0, self.attack_len, 0, 1, self.attack_power, np.clip(times, 0, None)
+        )
+        decay = powerlerp(
+            self.attack_len,
+            decay_end,
+            1,
+            self.sustain_amp,
+            self.decay_power,
+            np.clip(times, self.attack_len, None),
+        )
+        release = powerlerp(
+            self.note_length,
+            release_end,
+            self.attack_envelope(self.note_length),
+            0,
+            self.release_power,
+            np.clip(times, self.note_length, None),
+        )
+        held = np.select(
+            [times < self.attack_len, times < decay_end],
+            [attack, decay],
+            self.sustain_amp,
+        )
+        return np.select(
+            [times < self.note_length, times < release_end], [held, release]
+        )
+
+    def parameters(self) -> tuple:
+        return (
+            self.attack_len,
+            self.decay_len,
+            self.release_len,
+            self.sustain_amp,
+            self.attack_power,
+            self.decay_power,
+            self.release_power,
+            self.note_length,
+            self.source.parameters(),
+        )
+
+    def render_block(self, start, frames):
+        if not self.enabled:
+            return np.zeros(frames)
+        times = np.arange(start, start + frames) / self.samplerate
+        return self.envelope_block(times) * self.source.render_block(start, frames)
+
+    def render_into(self, out: np.ndarray, start: int):
+        if not self.enabled:
+            out.fill(0)
+            return
+        super().render_into(out, start)
+
+    def kernels(self):
+        return self.source.kernels() + [self.envelope_into]
+
+    def envelope_into(self, indices: np.ndarray, out: np.ndarray):
+        """Multiply out by the envelope at ascending indices. Like
+        envelope_block, phase by phase in place."""
+        if not self.enabled:
+            out.fill(0)
+            return
+        times = self.work_array("times", len(indices))
+        np.divide(indices, self.samplerate, out=times)
+        decay_end = self.attack_len + self.decay_len
+        release_end = self.note_length + self.release_len
+        # where each phase ends, the held ones cut off at the release,
+        # found before times are overwritten
+        attack, decay, held = (
+            int(np.searchsorted(times, min(end, self.note_length)))
+            for end in (self.attack_len, decay_end, self.note_length)
+        )
+        decay = max(decay, attack)
+        released = max(int(np.searchsorted(times, release_end)), held)
+        self._powerlerp_into(
+            times[:attack], 0, self.attack_len, 0, 1, self.attack_power
+        )
+        self._powerlerp_into(
+            times[attack:decay],
+            self.attack_len,
+            decay_end,
+            1,
+            self.sustain_amp,
+            self.decay_power,
+        )
+        times[decay:held] = self.sustain_amp
+        self._powerlerp_into(
+            times[held:released],
+            self.note_length,
+            release_end,
+            self.attack_envelope(self.note_length),
+            0,
+            self.release_power,
+        )
+        times[released:] = 0
+        out *= times
+
+    @staticmethod
+    def _powerlerp_into(
+        times: np.ndarray,
+        start_t: float,
+        end_t: float,
+        start_amp: float,
+        end_amp: float,
+        power: float,
+    ):
+        """powerlerp() of times in place, clipped to start_t first
+        like in envelope_block"""
+        if end_t - start_t == 0:
+            times.fill(end_amp)
+            return
+        # in powerlerp's order, to give the same
+        np.maximum(times, start_t, out=times)
+        times -= start_t
+        times /= end_t - start_t
+        times **= power
+        times *= end_amp - start_amp
+        times += start_amp
+
     def get_sample_at_index(self, index):
         if not self.enabled:
             return 0
@@ -200,6 +826,79 @@ class ADSR(Sampleable):
         return envelope * self.source.get_sample_at_index(index)
 
 
+class NoteCache:
+    """Renders of a synth's notes, as float32 buffers keyed by
+    (MIDI pitch, synth parameters). Filled by a background thread."""
+
+    def __init__(self):
+        self._buffers: dict[tuple[int, tuple], np.ndarray] = {}
+
+    def get(self, synth: ADSR, pitch: int) -> np.ndarray | None:
+        """None if the note isn't rendered (yet)"""
+        return self._buffers.get((pitch, synth.parameters()))
+
+    @staticmethod
+    def render(synth: ADSR, pitch: int) -> np.ndarray:
+        synth = copy.deepcopy(synth)
+        synth.source.frequency = notes.freq_from_midi_index(pitch)
+        synth.enabled = True
+        frames = math.ceil((synth.note_length + synth.release_len) * synth.samplerate)
+        # played notes start at index 1, see Sampleable.__next__
+        return synth.render_block(1, frames).astype(np.float32)
+
+    def fill(self, synth: ADSR, pitches) -> threading.Thread:
+        """Render pitches in the background"""
+        synth = copy.deepcopy(synth)  # so later changes don't mix in
+
+        def run():
+            key = synth.parameters()
+            for pitch in pitches:
+                self._buffers[(pitch, key)] = self.render(synth, pitch)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+
+class BufferPlayer(Sampleable):
+    """Plays prerendered buffers, like from a NoteCache"""
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self.commands = CommandQueue()
+
+    def play(self, buffer: np.ndarray):
+        """Start buffer from the next block"""
+        self.commands.post(self._play, buffer)
+
+    def stop(self):
+        self.play(np.zeros(0, dtype=np.float32))
+
+    def _play(self, buffer: np.ndarray):
+        self._buffer = buffer
+        self.sample_index = 0
+
+    def begin_block(self, dac_time: float = 0):
+        self.commands.flush()
+        super().begin_block(dac_time)
+
+    def render_block(self, start, frames):
+        out = np.zeros(frames)
+        self.render_into(out, start)
+        return out
+
+    def render_into(self, out, start):
+        played = self._buffer[start - 1 : start - 1 + len(out)]
+        out[: len(played)] = played
+        out[len(played) :] = 0
+
+    def get_sample_at_index(self, index):
+        if 0 < index <= len(self._buffer):
+            return self._buffer[index - 1]
+        return 0
+
+
 class Note:
     def __init__(
         self, time: float, length: float, frequency: float = settings.concert_a_freq
@@ -261,6 +960,239 @@ class PitchedNote(Note):
         self.frequency = notes.freq_from_midi_index(val)
 
 
+class NoteIndex:
+    """Sorted list of non-overlapping notes. Lookups by time
+    are binary searches over the note start times."""
+
+    def __init__(self, notes: list[Note] = []):
+        self._notes: list[Note] = []
+        self._starts: list[float] = []
+        for note in sorted(notes):
+            self.insert(note)
+
+    @classmethod
+    def from_sorted(cls, notes: list[Note]) -> "NoteIndex":
+        """Build from notes already sorted and checked for overlap"""
+        index = cls()
+        index._notes = list(notes)
+        index._starts = [note.start for note in index._notes]
+        return index
+
+    @property
+    def notes(self) -> list[Note]:
+        return self._notes
+
+    def __len__(self) -> int:
+        return len(self._notes)
+
+    def __iter__(self):
+        return iter(self._notes)
+
+    def overlapping(self, note: Note) -> list[Note]:
+        # notes are sorted and disjoint, so the notes overlapping
+        # a new note are a run starting at its predecessor
+        first = max(bisect.bisect_right(self._starts, note.start) - 1, 0)
+        last = bisect.bisect_left(self._starts, note.end)
+        return [
+            other
+            for other in self._notes[first : last + 1]
+            if note.overlaps(other) or other.overlaps(note)
+        ]
+
+    def insert(self, note: Note):
+        if self.overlapping(note):
+            raise ValueError("Overlap was detected while inserting note")
+        position = bisect.bisect_right(self._starts, note.start)
+        self._starts.insert(position, note.start)
+        self._notes.insert(position, note)
+
+    def index_of_time(self, time: float) -> int | None:
+        """Index of the note starting exactly at time"""
+        position = bisect.bisect_left(self._starts, time)
+        if position < len(self._starts) and self._starts[position] == time:
+            return position
+        return None
+
+    def pop_at_time(self, time: float) -> Note | None:
+        position = self.index_of_time(time)
+        if position is None:
+            return None
+        self._starts.pop(position)
+        return self._notes.pop(position)
+
+    def in_range(self, start: float, end: float) -> list[Note]:
+        """Notes that sound at some point between start and end"""
+        first = max(bisect.bisect_right(self._starts, start) - 1, 0)
+        last = bisect.bisect_left(self._starts, end)
+        if first < last and self._notes[first].end <= start:
+            first += 1
+        return self._notes[first:last]
+
+    def find(self, time: float) -> Note | None:
+        """Note containing time, if any"""
+        position = bisect.bisect_right(self._starts, time) - 1
+        if position >= 0 and self._notes[position].contains(time):
+            return self._notes[position]
+        return None
+
+
+class NoteEdit:
+    """Incremental change to a set of notes. Notes are
+    identified by start time, which is unique since
+    notes may not overlap."""
+
+    def apply(self, index: NoteIndex) -> list[Note]:
+        """Apply to index, returning the notes removed"""
+        raise NotImplementedError
+
+
+class AddNote(NoteEdit):
+    def __init__(self, note: Note):
+        self.note = note
+
+    def apply(self, index: NoteIndex) -> list[Note]:
+        index.insert(self.note)
+        return []
+
+
+class RemoveNote(NoteEdit):
+    def __init__(self, time: float):
+        self.time = time
+
+    def apply(self, index: NoteIndex) -> list[Note]:
+        removed = index.pop_at_time(self.time)
+        return [] if removed is None else [removed]
+
+
+class MoveNote(NoteEdit):
+    """Replace the note starting at .time with .note"""
+
+    def __init__(self, time: float, note: Note):
+        self.time = time
+        self.note = note
+
+    def apply(self, index: NoteIndex) -> list[Note]:
+        removed = index.pop_at_time(self.time)
+        try:
+            index.insert(self.note)
+        except ValueError:
+            if removed is not None:
+                index.insert(removed)  # leave index unchanged
+            raise
+        return [] if removed is None else [removed]
+
+
+class TempoMap:
+    """Piecewise tempo for converting between sample indices
+    and beats. Each segment starts at a sample index and beat,
+    and its BPM changes linearly by .slope per sample until
+    the next segment starts. The segment table is replaced,
+    never modified, so it can be read from any thread."""
+
+    def __init__(
+        self, bpm: float, samplerate=settings.samplerate, start=0, beat: float = 0.0
+    ):
+        """beat is reached at index start, at bpm from then on"""
+        self.samplerate = samplerate
+        self.reset(bpm, start, beat)
+
+    def reset(self, bpm: float, start=0, beat: float = 0.0):
+        # (start indices, start beats, start BPMs, slopes)
+        self._table = ([start], [beat], [bpm], [0.0])
+
+    @staticmethod
+    def _beats_in(bpm: float, slope: float, length: float, samplerate) -> float:
+        return (bpm * length + slope * length * length / 2) / (60 * samplerate)
+
+    def _segment(self, index: float) -> int:
+        return max(bisect.bisect_right(self._table[0], index) - 1, 0)
+
+    def beat_at(self, index: float) -> float:
+        starts, beats, bpms, slopes = self._table
+        i = self._segment(index)
+        return beats[i] + self._beats_in(
+            bpms[i], slopes[i], index - starts[i], self.samplerate
+        )
+
+    def beats_into(self, indices: np.ndarray, out: np.ndarray, scratch: np.ndarray):
+        """Vectorized .beat_at of ascending indices, for rendering whole
+        blocks, into out. scratch is as long, and overwritten."""
+        starts, beats, bpms, slopes = self._table
+        first, last = self._segment(indices[0]), self._segment(indices[-1])
+        for i in range(first, last + 1):
+            # the indices in segment i, the first and last taking in the rest
+            begin = 0 if i == first else int(np.searchsorted(indices, starts[i]))
+            end = len(indices)
+            if i < last:
+                end = int(np.searchsorted(indices, starts[i + 1]))
+            length = np.subtract(indices[begin:end], starts[i], out=out[begin:end])
+            # in the order of _beats_in, to give the same as .beat_at
+            curve = np.multiply(length, slopes[i], out=scratch[begin:end])
+            curve *= length
+            curve /= 2
+            length *= bpms[i]
+            length += curve
+            length /= 60 * self.samplerate
+            length += beats[i]
+
+    def bpm_at(self, index: float) -> float:
+        starts, _, bpms, slopes = self._table
+        i = self._segment(index)
+        return bpms[i] + slopes[i] * (index - starts[i])
+
+    def sample_at(self, beat: float) -> float:
+        """Sample index at which beat is reached"""
+        starts, beats, bpms, slopes = self._table
+        i = max(bisect.bisect_right(beats, beat) - 1, 0)
+        target = (beat - beats[i]) * 60 * self.samplerate
+        if slopes[i] == 0:
+            return starts[i] + target / bpms[i]
+        # solve slope / 2 * x^2 + bpm * x = target for x
+        discriminant = max(bpms[i] * bpms[i] + 2 * slopes[i] * target, 0)
+        return starts[i] + (math.sqrt(discriminant) - bpms[i]) / slopes[i]
+
+    def _append(self, index: float, bpm: float, slope: float, table=None):
+        """Table with every segment from index on replaced by a new one"""
+        starts, beats, bpms, slopes = self._table if table is None else table
+        beat = self.beat_at(index) if table is None else self._end_beat(table, index)
+        keep = bisect.bisect_left(starts, index)
+        return (
+            starts[:keep] + [index],
+            beats[:keep] + [beat],
+            bpms[:keep] + [bpm],
+            slopes[:keep] + [slope],
+        )
+
+    def _end_beat(self, table, index: float) -> float:
+        starts, beats, bpms, slopes = table
+        return beats[-1] + self._beats_in(
+            bpms[-1], slopes[-1], index - starts[-1], self.samplerate
+        )
+
+    def constant_segment(self, start: float, end: float) -> tuple | None:
+        """(start index, beat, BPM) of the segment from index start to
+        end if the tempo doesn't change in between, otherwise None"""
+        starts, beats, bpms, slopes = self._table
+        i = self._segment(start)
+        if slopes[i] != 0 or (i + 1 < len(starts) and starts[i + 1] <= end):
+            return None
+        return (starts[i], beats[i], bpms[i])
+
+    def set_bpm(self, bpm: float, index: float):
+        """Change tempo from index on, continuing from the beat
+        reached there so playback doesn't jump"""
+        self._table = self._append(index, bpm, 0.0)
+
+    def ramp(self, end_bpm: float, beats: float, index: float):
+        """Change tempo smoothly to end_bpm over beats from index,
+        then hold end_bpm"""
+        start_bpm = self.bpm_at(index)
+        # beats = average bpm * length / (60 * samplerate)
+        length = beats * 120 * self.samplerate / (start_bpm + end_bpm)
+        table = self._append(index, start_bpm, (end_bpm - start_bpm) / length)
+        self._table = self._append(index + length, end_bpm, 0.0, table)
+
+
 class Voice(Sampleable):
     def __init__(
         self,
@@ -270,8 +1202,9 @@ class Voice(Sampleable):
         bpm: float,
         pitched: bool = False,
         amplitude: float = 1,
+        pan: float = 0,
         *args,
-        **kw
+        **kw,
     ):
         """
         .notes is not guaranteed to
@@ -281,7 +1214,7 @@ class Voice(Sampleable):
 
         super().__init__(*args, **kw)
         self.synth = synth
-        self._notes = Voice.sort_notes(notes)
+        self._index = NoteIndex(notes)
         self.repeat_length = repeat_length
         self.bpm = bpm
         self.pitched = pitched
@@ -289,77 +1222,465 @@ class Voice(Sampleable):
         self.enabled = True
         self.playing_note: Note | None = None
         self.releasing_note: Note | None = None  # remember which note to release
+        self.commands: CommandQueue | None = None  # set while in a SyncedVoices
+        self.tempo_map: TempoMap | None = None  # set while in a SyncedVoices
+        self.note_start_index = 0.0  # of the releasing note, with a tempo map
+        self.channel = Channel(self, pan=pan)  # mixed by a SyncedVoices
+        self.revision = 0  # counts changes to the notes, see freeze_key()
+        self.frozen: FrozenLoop | None = None  # played instead while still current
+        self.freeze = False  # keep a FrozenLoop even if the SyncedVoices doesn't
+        self.reference = False  # render sample by sample, see reference
+        self._plan: RenderPlan | None = None
 
     @property
     def notes(self) -> list[Note]:
-        return self._notes
+        return self._index.notes
 
     @notes.setter
-    def notes(self, val: list[Note]):
-        self._notes = Voice.sort_notes(val)
+    def notes(self, val: list[Note] | NoteIndex):
+        self._index = val if isinstance(val, NoteIndex) else NoteIndex(val)
+        self.notes_changed()
         # don't hold on to references to possibly now nonexistent notes
         self.playing_note = None
         self.releasing_note = None
 
     @staticmethod
     def sort_notes(notes: list[Note]) -> list[Note]:
-        final = []
-        for note in sorted(notes):
-            # check for overlap
-            for other in final:
-                if note.overlaps(other):
-                    raise Exception("Overlap was detected while verifying notes")
-            final.append(note)
-        return final
-
-    def update_synth(self, beat_time: float):
+        return NoteIndex(notes).notes
+
+    def post(self, command, *args):
+        """Run command on the audio thread if this voice is
+        being played, otherwise run it immediately"""
+        if self.commands is None:
+            command(*args)
+        else:
+            self.commands.post(command, *args)
+
+    def notes_changed(self):
+        self.revision += 1
+        self.unfreeze()  # so notes being edited are heard right away
+
+    def unfreeze(self):
+        """Go back to rendering live"""
+        self.freeze = False
+        self.frozen = None
+
+    def apply_edit(self, edit: NoteEdit):
+        """Apply an incremental edit without touching
+        notes that are still sounding"""
+        removed = edit.apply(self._index)
+        self.notes_changed()
+        if self.playing_note in removed:
+            # let the removed note release instead of cutting it off
+            self.playing_note = None
+
+    def rewind(self):
+        """Start over with no note playing, so notes sounding when
+        playback stopped aren't carried on from their old start"""
+        super().rewind()
+        self.playing_note = None
+        self.releasing_note = None
+        self.note_start_index = 0.0
+        self.synth.rewind()
+
+    def update_synth(self, beat_time: float, index: float = 0):
         if (self.playing_note is not None) and (self.playing_note.contains(beat_time)):
             return  # still the same note, don't do anything
         # still slow for rests, but rests don't play anything
 
         # determine which note we are using
-        self.playing_note = None
-        for note in self._notes:
-            if note.contains(beat_time):
-                self.playing_note = note
-                self.releasing_note = note
-                break
+        self.playing_note = self._index.find(beat_time)
+        if self.playing_note is not None:
+            self.releasing_note = self.playing_note
 
         # this code only runs if starting a new note
         if self.playing_note is not None:
             self.synth.source.rewind()  # for round robin synths
-            self.synth.note_length = self.playing_note.length * 60 / self.bpm
+            if self.tempo_map is None:
+                self.synth.note_length = self.playing_note.length * 60 / self.bpm
+            else:
+                # the tempo may change during the note
+                beat = self.tempo_map.beat_at(index) - beat_time
+                self.note_start_index = self.tempo_map.sample_at(
+                    beat + self.playing_note.start
+                )
+                note_end_index = self.tempo_map.sample_at(beat + self.playing_note.end)
+                self.synth.note_length = (
+                    note_end_index - self.note_start_index
+                ) / self.samplerate
             if self.pitched:
                 self.synth.source.frequency = self.playing_note.frequency  # type: ignore
 
-    def calculate_synth_index(self, beat_time: float) -> int:
+    def calculate_synth_index(self, beat_time: float, index: float = 0) -> int:
+        if self.tempo_map is not None:
+            return index - self.note_start_index
         time_offset = self.releasing_note.time
         # handle wrap-around
         if self.releasing_note.time > beat_time:
             time_offset -= self.repeat_length
         return (beat_time - time_offset) * round(self.samplerate / (self.bpm / 60))
 
+    def beat_at(self, index: float) -> float:
+        """Position in the repeating pattern at sample index"""
+        if self.tempo_map is not None:
+            return self.tempo_map.beat_at(index) % self.repeat_length
+        return (index * (self.bpm / 60) / self.samplerate) % self.repeat_length
+
+    def freeze_key(self, segment: tuple | None) -> tuple:
+        """What a FrozenLoop of this voice depends on, with segment from
+        TempoMap.constant_segment. .amplitude isn't part of it, as it
+        is applied on playback."""
+        return (self.revision, self.repeat_length, segment)
+
+    def plays_frozen(self, start: int, frames: int) -> bool:
+        """Whether .frozen is current for the block"""
+        frozen = self.frozen
+        if not self.enabled or frozen is None or self.tempo_map is None:
+            return False
+        segment = self.tempo_map.constant_segment(start, start + frames)
+        if frozen.key != self.freeze_key(segment) or not frozen.playable:
+            return False
+        # notes begun on another tempo may not end where the loop's do
+        return self.releasing_note is None or self.note_start_index >= segment[0]
+
+    def chain(self) -> list[Sampleable]:
+        """The synth and the sources it wraps, outermost first"""
+        links = [self.synth]
+        while hasattr(links[-1], "source"):
+            links.append(links[-1].source)
+        return links
+
+    def compile(self) -> "RenderPlan":
+        """Plan for rendering blocks, updated when notes or synth change"""
+        if self._plan is None:
+            self._plan = RenderPlan(self)
+        elif not self._plan.matches(self):
+            self._plan.update(self)
+        return self._plan
+
+    def render_block(self, start, frames):
+        out = np.zeros(frames)
+        self.render_into(out, start)
+        return out
+
+    def render_into(self, out, start):
+        if self.reference or self.tempo_map is None:
+            # what faster paths must match, or timed by .bpm alone
+            out[:] = super().render_block(start, len(out))
+        elif self.plays_frozen(start, len(out)):
+            self.frozen.render_into(out, start, self.amplitude)
+            # so rendering live again carries on from the same notes
+            self.compile().follow(self, start, len(out))
+        else:
+            self.compile().render_into(self, out, start)
+
     def get_sample_at_index(self, index):
         if not self.enabled:
             return 0
 
-        beat_time = (index * (self.bpm / 60) / self.samplerate) % self.repeat_length
-        self.update_synth(beat_time)
+        beat_time = self.beat_at(index)
+        self.update_synth(beat_time, index)
 
         if self.releasing_note is None:
             return 0
 
         return self.amplitude * self.synth.get_sample_at_index(
-            self.calculate_synth_index(beat_time)
+            self.calculate_synth_index(beat_time, index)
         )
 
 
+class RenderPlan:
+    """A voice compiled for rendering whole blocks at once. Its notes
+    become arrays, to find where notes change in a block, and the chain
+    of its synth and sources a flat list of vectorized kernels, see
+    Sampleable.kernels. Between note changes, the kernels run one after
+    another over the same buffer, however deep the chain. Voice.compile()
+    rebuilds the plan when the notes or the chain change.
+
+    At note changes, Voice.update_synth() sets up the synth like it
+    does when rendering sample by sample, which stays the reference."""
+
+    def __init__(self, voice: Voice):
+        self.links = voice.chain()
+        self.kernels = voice.synth.kernels()
+        self._read_notes(voice)
+        # for each block, grown to the largest
+        self._offsets = np.zeros(0)
+        self._indices = np.zeros(0)
+        self._beats = np.zeros(0)
+        self._scratch = np.zeros(0)
+        self._wraps = np.zeros(0, dtype=bool)
+        self._synth_indices = np.zeros(0)
+
+    def _read_notes(self, voice: Voice):
+        notes = voice.notes
+        self.revision = voice.revision
+        self.starts = [note.start for note in notes]
+        self.ends = [note.end for note in notes]
+        self.ids = {note: i for i, note in enumerate(notes)}
+
+    def matches(self, voice: Voice) -> bool:
+        return self.revision == voice.revision and self.links == voice.chain()
+
+    def update(self, voice: Voice):
+        """Catch up with voice's notes and chain. Edited notes, the
+        usual change, only take reading them again, the buffers
+        are kept."""
+        if self.revision != voice.revision:
+            self._read_notes(voice)
+        links = voice.chain()
+        if self.links != links:
+            self.links = links
+            self.kernels = voice.synth.kernels()
+            if len(self._offsets):
+                self._prime()
+
+    def _grow(self, frames: int):
+        if len(self._indices) < frames:
+            self._offsets = np.arange(frames, dtype=np.float64)
+            self._indices = np.zeros(frames)
+            self._beats = np.zeros(frames)
+            self._scratch = np.zeros(frames)
+            self._wraps = np.zeros(frames, dtype=bool)
+            self._synth_indices = np.zeros(frames)
+            self._prime()
+
+    def _prime(self):
+        # so sources grow their work arrays now, not at the first note
+        for kernel in self.kernels:
+            kernel(self._offsets, self._synth_indices)
+
+    def note_at(self, beat: float) -> int:
+        """Index of the note containing beat, like NoteIndex.find,
+        or -1 if there is none"""
+        i = bisect.bisect_right(self.starts, beat) - 1
+        # notes contain neither their start nor their end, see Note.contains
+        if i >= 0 and self.starts[i] < beat < self.ends[i]:
+            return i
+        return -1
+
+    def changes(self, voice: Voice, start: int, frames: int) -> tuple:
+        """(indices, beats, offsets of note changes) of a block. Beats
+        only go down where the pattern repeats, and in between, notes
+        only change where beats pass their starts and ends."""
+        self._grow(frames)
+        indices = np.add(self._offsets[:frames], start, out=self._indices[:frames])
+        beats = self._beats[:frames]
+        voice.tempo_map.beats_into(indices, beats, self._scratch[:frames])
+        np.remainder(beats, voice.repeat_length, out=beats)
+        wraps = np.less(beats[1:], beats[:-1], out=self._wraps[: frames - 1])
+        runs = [0, frames]
+        if np.count_nonzero(wraps):  # flatnonzero() allocates, even for none
+            runs[1:1] = [int(wrap) + 1 for wrap in np.flatnonzero(wraps)]
+
+        changes = []
+        playing = self.ids.get(voice.playing_note, -1)
+        for run_start, run_end in zip(runs, runs[1:]):
+            run = beats[run_start:run_end]
+            low, high = float(run[0]), float(run[-1])
+            candidates = {run_start}
+            # a note is entered after its start, and left at its end
+            for bounds, side in ((self.starts, "right"), (self.ends, "left")):
+                first = bisect.bisect_left(bounds, low)
+                for bound in bounds[first : bisect.bisect_right(bounds, high)]:
+                    candidates.add(run_start + int(np.searchsorted(run, bound, side)))
+            for candidate in sorted(candidates):
+                if candidate < run_end:
+                    found = self.note_at(float(beats[candidate]))
+                    if found != playing:
+                        changes.append(candidate)
+                        playing = found
+        return indices, beats, changes
+
+    def follow(self, voice: Voice, start: int, frames: int):
+        """Change notes like rendering the block would, without
+        rendering it, for voices played from a FrozenLoop"""
+        _, beats, changes = self.changes(voice, start, frames)
+        for change in changes:
+            voice.update_synth(float(beats[change]), start + change)
+
+    def render_into(self, voice: Voice, out: np.ndarray, start: int):
+        if not voice.enabled:
+            out.fill(0)
+            return
+        frames = len(out)
+        indices, beats, changes = self.changes(voice, start, frames)
+
+        first, kernels = self.kernels[0], self.kernels[1:]
+        segment_start = 0
+        for segment_end in changes + [frames]:
+            if segment_end > segment_start:
+                segment = out[segment_start:segment_end]
+                if voice.releasing_note is None:
+                    segment.fill(0)
+                else:
+                    synth_indices = np.subtract(
+                        indices[segment_start:segment_end],
+                        voice.note_start_index,
+                        out=self._synth_indices[segment_start:segment_end],
+                    )
+                    first(synth_indices, segment)
+                    for kernel in kernels:
+                        kernel(synth_indices, segment)
+                    segment *= voice.amplitude
+            if segment_end < frames:
+                voice.update_synth(float(beats[segment_end]), start + segment_end)
+            segment_start = segment_end
+
+
+class FrozenLoop:
+    """A voice rendered ahead at a constant tempo, to be played back
+    instead of rendering it live. Rendered at the sample indices it
+    is played at, over as many cycles of its pattern as it takes for
+    those to fall on the same points of the pattern again, so it
+    sounds exactly like rendering live. Voices whose sound varies
+    get at least settings.freeze_cycles, to keep some of their round
+    robin. Loops longer than settings.freeze_max_seconds, like those
+    of tempos with a long period, aren't rendered, and aren't
+    .playable. Rendered without .amplitude."""
+
+    def __init__(
+        self,
+        voice: Voice,
+        notes: list[Note],
+        segment: tuple,
+        synth: Sampleable | None = None,
+        key: tuple | None = None,
+    ):
+        """notes are those of voice when key was taken, segment from
+        TempoMap.constant_segment. Rendered on another thread, synth
+        and key are to be taken with notes, while voice can't change.
+        By default they are voice's now."""
+        self.key = voice.freeze_key(segment) if key is None else key
+        start, beat, bpm = segment
+        synth = copy.deepcopy(voice.synth) if synth is None else synth
+        synth.enabled = True
+        samplerate = voice.samplerate
+        repeat_length = self.key[1]  # as when notes were taken
+        cycles = settings.freeze_cycles if synth.source.varies else 1
+        self.start = math.ceil(start)  # index of the first sample
+        self._buffer: np.ndarray | None = None
+        frames = FrozenLoop.frames_for(repeat_length, bpm, samplerate, cycles)
+        if frames > settings.freeze_max_seconds * samplerate:
+            return
+
+        # a copy of the voice, on the same tempo segment from long before
+        renderer = Voice(
+            synth, notes, repeat_length, bpm, voice.pitched, samplerate=samplerate
+        )
+        renderer.tempo_map = TempoMap(bpm, samplerate, start, beat)
+        # from when notes sounding at .start began, release tails included
+        warmup = math.ceil(
+            repeat_length * 60 * samplerate / bpm + synth.release_len * samplerate
+        )
+        buffer = np.zeros(frames, dtype=np.float32)
+        block = np.zeros(settings.chunksize)
+        for index in range(self.start - warmup, self.start + frames, len(block)):
+            renderer.render_into(block, index)
+            first = index - self.start
+            kept = block[max(-first, 0) : frames - first]
+            buffer[max(first, 0) : max(first, 0) + len(kept)] = kept
+        self._buffer = buffer
+
+    @staticmethod
+    def frames_for(repeat_length: float, bpm: float, samplerate, cycles: int) -> int:
+        """Samples in the shortest loop of at least cycles of the
+        pattern that is a whole number of samples long"""
+        cycle = (
+            fractions.Fraction(60 * samplerate)
+            * fractions.Fraction(repeat_length)
+            / fractions.Fraction(bpm)
+        )
+        # cycles it takes to end on a whole sample
+        period = cycle.denominator
+        return int(cycle * period * math.ceil(cycles / period))
+
+    @property
+    def playable(self) -> bool:
+        return self._buffer is not None
+
+    def render_into(self, out: np.ndarray, start: int, gain: float = 1):
+        """Samples from index start on, times gain. The tempo must
+        be on the segment frozen at."""
+        position = (start - self.start) % len(self._buffer)
+        done = 0
+        while done < len(out):
+            # read on to the end of the loop, then from its start
+            frames = min(len(out) - done, len(self._buffer) - position)
+            played = out[done : done + frames]
+            played[:] = self._buffer[position : position + frames]
+            played *= gain
+            done += frames
+            position = 0
+
+
+class LoopFreezer:
+    """Renders FrozenLoops on a background thread and hands them
+    to the audio thread through commands, to be swapped in
+    between blocks if the voice hasn't changed since"""
+
+    def __init__(self, commands: CommandQueue):
+        self._commands = commands
+        self._requests = queue.SimpleQueue()
+        self._pending: dict[Voice, tuple] = {}  # keys being rendered
+        self._thread: threading.Thread | None = None
+
+    def request(self, voice: Voice, segment: tuple):
+        """Called on the audio thread, where notes don't change"""
+        key = voice.freeze_key(segment)
+        if self._pending.get(voice) == key:
+            return
+        self._pending[voice] = key
+        # copied here, as the audio thread keeps rendering with the synth
+        synth = copy.deepcopy(voice.synth)
+        self._requests.put((voice, list(voice.notes), segment, synth, key))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            voice, notes, segment, synth, key = self._requests.get()
+            if self._pending.get(voice) != key:
+                continue  # changed again while waiting
+            try:
+                loop = FrozenLoop(voice, notes, segment, synth, key)
+            except Exception as e:
+                # the voice keeps playing live, and this thread other voices
+                print(f"Warning: could not freeze a voice: {e!r}")
+                continue
+            self._commands.post(self._install, voice, loop)
+
+    def _install(self, voice: Voice, loop: FrozenLoop):
+        if self._pending.get(voice) == loop.key:
+            del self._pending[voice]
+        if voice.freeze_key(loop.key[-1]) == loop.key:
+            voice.frozen = loop
+
+
 class SyncedVoices(Sampleable):
+    """Plays voices in time, mixed in stereo through a bus
+    with a group bus each for pitched and unpitched voices"""
+
     def __init__(self, voices: list[Voice], bpm: float, *args, **kw):
         super().__init__(*args, **kw)
+        self.stereo = True
         self._bpm = bpm
         self._voices = voices
         self.enabled = True
+        self.commands = CommandQueue()
+        self.tempo_map = TempoMap(bpm, self.samplerate)
+        self.groups = {
+            pitched: Channel(MixerBus(samplerate=self.samplerate))
+            for pitched in (False, True)
+        }
+        self.bus = MixerBus(list(self.groups.values()), samplerate=self.samplerate)
+        # play voices from FrozenLoops while their notes and the tempo don't change
+        self.freeze = False
+        self.freezer = LoopFreezer(self.commands)
+        for voice in self._voices:
+            voice.commands = self.commands
+            self.group_of(voice).add(voice.channel)
         self.sync_bpm()
 
     @property
@@ -369,6 +1690,8 @@ class SyncedVoices(Sampleable):
     @bpm.setter
     def bpm(self, val: float):
         self._bpm = val
+        # continue from the current beat at the new tempo
+        self.tempo_map.set_bpm(val, self.sample_index + 1)
         self.sync_bpm()
 
     @property
@@ -378,11 +1701,98 @@ class SyncedVoices(Sampleable):
     @voices.setter
     def voices(self, val: list[Voice]):
         self._voices = val
+        for group in self.groups.values():
+            group.source.channels = [
+                voice.channel for voice in val if self.group_of(voice) is group.source
+            ]
         self.sync_bpm()
 
+    def group_of(self, voice: Voice) -> MixerBus:
+        return self.groups[voice.pitched].source
+
     def sync_bpm(self):
         for voice in self._voices:
             voice.bpm = self._bpm
+            voice.tempo_map = self.tempo_map
+
+    def begin_block(self, dac_time: float = 0):
+        self.commands.flush()
+        super().begin_block(dac_time)  # after flushing, which may rewind
+        self.request_frozen()
+        # what is heard first was rendered that much earlier
+        block_index, dac_time = self.block_timing
+        self.block_timing = (block_index - self.bus.latency, dac_time)
+
+    def post(self, command, *args):
+        """Run command on the audio thread at the next block"""
+        self.commands.post(command, *args)
+
+    def request_frozen(self):
+        """Freeze voices whose FrozenLoop is missing or out of date, all
+        of them if .freeze is set, otherwise those with Voice.freeze set.
+        Only if the tempo stays the same from here on."""
+        for voice in self._voices:
+            if self.freeze or voice.freeze:
+                break
+        else:
+            return  # nothing to freeze, checked without a generator
+        segment = self.tempo_map.constant_segment(self.sample_index + 1, math.inf)
+        if segment is None:
+            return
+        for voice in self._voices:
+            if (self.freeze or voice.freeze) and voice.enabled:
+                key = voice.freeze_key(segment)
+                if voice.frozen is None or voice.frozen.key != key:
+                    self.freezer.request(voice, segment)
+
+    def rewind(self):
+        super().rewind()
+        self.tempo_map.reset(self._bpm)
+        for voice in self._voices:
+            voice.rewind()
+
+    def set_bpm(self, val: float):
+        self.post(setattr, self, "bpm", val)
+
+    def ramp_bpm(self, end_bpm: float, beats: float):
+        """Accelerate or slow down to end_bpm over beats"""
+        self.post(self._ramp_bpm, end_bpm, beats)
+
+    def _ramp_bpm(self, end_bpm: float, beats: float):
+        self.tempo_map.ramp(end_bpm, beats, self.sample_index + 1)
+        self._bpm = end_bpm
+        for voice in self._voices:
+            voice.bpm = end_bpm
+
+    def add_voice(self, voice: Voice):
+        voice.commands = self.commands
+        self.post(self._add_voice, voice)
+
+    def remove_voice(self, voice: Voice):
+        self.post(self._remove_voice, voice)
+
+    def _add_voice(self, voice: Voice):
+        self._voices.append(voice)
+        self.group_of(voice).add(voice.channel)
+        voice.bpm = self._bpm
+        voice.tempo_map = self.tempo_map
+
+    def _remove_voice(self, voice: Voice):
+        self._voices.remove(voice)
+        self.group_of(voice).remove(voice.channel)
+        voice.commands = None
+        voice.tempo_map = None
+
+    def render_block(self, start: int, frames: int) -> np.ndarray:
+        if not self.enabled:
+            return np.zeros((frames, 2))
+        return self.bus.render_block(start, frames)
+
+    def render_into(self, out, start):
+        if not self.enabled:
+            out.fill(0)
+            return
+        self.bus.render_into(out, start)
 
     def get_sample_at_index(self, index):
         if not self.enabled:
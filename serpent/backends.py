@@ -0,0 +1,174 @@
+"""Outputs for Player. A backend opens streams that call
+render(dac_time, underflow) for each block, which returns float32
+frames of shape (chunksize, channels). Streams have the methods of
+PyAudio streams that Player uses: get_time, stop_stream and close.
+
+Only PyAudioBackend needs PyAudio, and imports it when created."""
+
+import threading
+import time
+import wave
+
+import numpy as np
+
+
+class PyAudioBackend:
+    """Plays on the default output device"""
+
+    def __init__(self):
+        import pyaudio  # only needed to play on a device
+
+        self._pyaudio_module = pyaudio
+        self._pyaudio = pyaudio.PyAudio()
+        self.offline = False
+
+    def samplerate_for(self, samplerate: int, channels: int) -> int:
+        """samplerate if the output device can play it, otherwise
+        the device's own rate, which is then resampled to"""
+        pyaudio = self._pyaudio_module
+        try:
+            device = self._pyaudio.get_default_output_device_info()
+        except IOError:
+            return samplerate  # let opening the stream report it
+        try:
+            self._pyaudio.is_format_supported(
+                samplerate,
+                output_device=device["index"],
+                output_channels=channels,
+                output_format=pyaudio.paFloat32,
+            )
+            return samplerate
+        except ValueError:
+            rate = round(device["defaultSampleRate"])
+            print(f"Warning: output device can't play {samplerate} Hz, resampling")
+            return rate
+
+    def open(self, render, samplerate: int, channels: int, chunksize: int):
+        pyaudio = self._pyaudio_module
+
+        def callback(in_data, frame_count, time_info, status_flags):
+            # some host APIs leave the DAC time at zero
+            dac_time = time_info.get("output_buffer_dac_time") or time_info.get(
+                "current_time", 0
+            )
+            samples = render(dac_time, bool(status_flags & pyaudio.paOutputUnderflow))
+            # rows are frames, so C order is already interleaved. PyAudio
+            # takes bytes, allocated even when rendering is not, see allocations
+            return (samples.tobytes(), pyaudio.paContinue)
+
+        return self._pyaudio.open(
+            format=pyaudio.paFloat32,
+            channels=channels,
+            rate=samplerate,
+            output=True,
+            frames_per_buffer=chunksize,
+            stream_callback=callback,
+        )
+
+
+class OfflineStream:
+    """Renders only when asked to by .advance(), as fast as possible.
+    Time is the duration rendered so far."""
+
+    def __init__(self, render, samplerate: int, write=None):
+        self._render = render
+        self._samplerate = samplerate
+        self._write = write
+        self._frames = 0
+
+    def get_time(self) -> float:
+        return self._frames / self._samplerate
+
+    def advance(self, frames: int):
+        """Render at least frames, in whole blocks"""
+        end = self._frames + frames
+        while self._frames < end:
+            samples = self._render(self.get_time(), False)
+            self._frames += len(samples)
+            if self._write is not None:
+                self._write(samples)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RealtimeStream:
+    """Renders blocks in a thread at the pace they would be played"""
+
+    def __init__(self, render, samplerate: int, chunksize: int):
+        self._render = render
+        self._period = chunksize / samplerate
+        self._start = time.monotonic()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def get_time(self) -> float:
+        return time.monotonic() - self._start
+
+    def _run(self):
+        deadline = self.get_time()
+        while not self._stopped.is_set():
+            late = self.get_time() > deadline + self._period
+            self._render(deadline + self._period, late)
+            deadline += self._period
+            self._stopped.wait(max(deadline - self.get_time(), 0))
+
+    def stop_stream(self):
+        self._stopped.set()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+
+
+class NullBackend:
+    """Discards output. Realtime streams keep the pace of a device,
+    others render only when asked to, see OfflineStream."""
+
+    def __init__(self, realtime: bool = False):
+        self.offline = not realtime
+
+    def samplerate_for(self, samplerate: int, channels: int) -> int:
+        return samplerate
+
+    def open(self, render, samplerate: int, channels: int, chunksize: int):
+        if self.offline:
+            return OfflineStream(render, samplerate)
+        return RealtimeStream(render, samplerate, chunksize)
+
+
+class FileStream(OfflineStream):
+    def __init__(self, render, samplerate: int, channels: int, path: str):
+        self._file = wave.open(path, "wb")
+        self._file.setnchannels(channels)
+        self._file.setsampwidth(2)
+        self._file.setframerate(samplerate)
+        super().__init__(render, samplerate, self.write)
+
+    def write(self, samples: np.ndarray):
+        self._file.writeframes(float_to_pcm16(samples).tobytes())
+
+    def close(self):
+        self._file.close()
+
+
+class FileBackend:
+    """Writes 16 bit WAV files, rendering as fast as possible"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offline = True
+
+    def samplerate_for(self, samplerate: int, channels: int) -> int:
+        return samplerate
+
+    def open(self, render, samplerate: int, channels: int, chunksize: int):
+        return FileStream(render, samplerate, channels, self.path)
+
+
+def float_to_pcm16(samples: np.ndarray) -> np.ndarray:
+    return np.round(np.clip(samples, -1, 1) * 32767).astype("<i2")
@@ -0,0 +1,163 @@
+"""Render libraries of practice loops from the command line.
+
+    python batch.py manifest.json [--workers N] [--force]
+
+The manifest lists projects, tempos and lengths, and every
+combination is rendered to a WAV file:
+
+    {
+        "output": "loops",
+        "arrangements": ["groove.serpent", "shuffle.serpent"],
+        "tempos": {"start": 60, "stop": 200, "step": 5},
+        "lengths": [8, 16]
+    }
+
+Paths are relative to the manifest. Tempos are BPM, either a list
+or an inclusive range. Lengths are in beats. Files that already
+exist are skipped, so an interrupted run can be resumed. Decoded
+samples are memory mapped from the output's .sample_cache, so
+workers share them instead of decoding their own."""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import time
+
+import settings
+
+
+class Job:
+    def __init__(self, arrangement: str, bpm: float, beats: float, path: str):
+        self.arrangement = arrangement
+        self.bpm = bpm
+        self.beats = beats
+        self.path = path
+
+
+def tempo_list(tempos) -> list[float]:
+    if isinstance(tempos, dict):
+        count = int((tempos["stop"] - tempos["start"]) // tempos["step"]) + 1
+        return [tempos["start"] + i * tempos["step"] for i in range(count)]
+    return list(tempos)
+
+
+def read_manifest(path: str) -> tuple[str, list[Job]]:
+    """(output directory, jobs)"""
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    output = os.path.join(base, manifest.get("output", "."))
+
+    jobs = []
+    for arrangement, bpm, beats in itertools.product(
+        manifest["arrangements"],
+        tempo_list(manifest["tempos"]),
+        manifest["lengths"],
+    ):
+        name = os.path.splitext(os.path.basename(arrangement))[0]
+        jobs.append(
+            Job(
+                os.path.join(base, arrangement),
+                bpm,
+                beats,
+                os.path.join(output, f"{name}_{bpm:g}bpm_{beats:g}beats.wav"),
+            )
+        )
+    return output, jobs
+
+
+# when this worker's pool was started, until its first job counts it
+_worker_started: float | None = None
+
+
+def init_worker(sample_cache_dir: str, pool_started: float):
+    global _worker_started
+    _worker_started = pool_started
+    # before presets are imported, so they load the shared samples
+    settings.sample_cache_dir = sample_cache_dir
+
+
+def render_job(job: Job) -> float:
+    """Render one loop, returns the seconds it took. A worker's
+    first job includes starting the worker and importing the
+    renderer, which would otherwise go unreported."""
+    global _worker_started
+    start = time.time() if _worker_started is None else _worker_started
+    _worker_started = None
+
+    import project
+    import render
+
+    loaded = project.load(job.arrangement)
+    loaded.bpm = job.bpm
+    synced_voices = render.project_voices(loaded)
+    samples = render.render(synced_voices, job.beats * 60 / job.bpm)
+    partial = f"{job.path}.partial"
+    try:
+        render.write_wav(partial, samples, synced_voices.samplerate)
+        os.replace(partial, job.path)  # only finished files count as done
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return time.time() - start
+
+
+def run(manifest: str, workers: int | None = None, force: bool = False):
+    output, jobs = read_manifest(manifest)
+    os.makedirs(output, exist_ok=True)
+    pending = [job for job in jobs if force or not os.path.exists(job.path)]
+    if len(pending) < len(jobs):
+        print(f"Skipping {len(jobs) - len(pending)} already rendered")
+    if not pending:
+        return
+
+    sample_cache_dir = os.path.join(output, ".sample_cache")
+    timings: list[tuple[Job, float]] = []
+    failures = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=init_worker,
+        initargs=(sample_cache_dir, time.time()),
+    ) as executor:
+        futures = {executor.submit(render_job, job): job for job in pending}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            job = futures[future]
+            name = os.path.basename(job.path)
+            try:
+                seconds = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(pending)}] {name} failed: {e}")
+                continue
+            timings.append((job, seconds))
+            print(f"[{done}/{len(pending)}] {name} {seconds:.2f} s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(timings)} files in {elapsed:.1f} s, {failures} failed")
+    if timings:
+        seconds = sorted(seconds for _, seconds in timings)
+        slowest_job, slowest = max(timings, key=lambda timing: timing[1])
+        print(
+            f"Per job: mean {sum(seconds) / len(seconds):.2f} s, "
+            f"median {seconds[len(seconds) // 2]:.2f} s, "
+            f"slowest {slowest:.2f} s ({os.path.basename(slowest_job.path)})"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render practice loops")
+    parser.add_argument("manifest")
+    parser.add_argument("--workers", type=int, help="default: one per CPU")
+    parser.add_argument(
+        "--force", action="store_true", help="render files that already exist"
+    )
+    args = parser.parse_args()
+    run(args.manifest, args.workers, args.force)
+
+
+if __name__ == "__main__":
+    main()
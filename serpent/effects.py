@@ -0,0 +1,416 @@
+"""Block based effects for MixerBus channels, buses and sends.
+
+Effects process stereo blocks of shape (frames, 2) and keep their
+state (delay lines, filter history) between blocks in buffers
+allocated up front. Processing in place with process_into doesn't
+allocate either, so they can run on the audio thread. That takes
+NumPy 2, the first whose FFTs write into out."""
+
+import math
+
+import numpy as np
+
+import settings
+
+if int(np.__version__.split(".")[0]) < 2:
+    raise ImportError(f"Serpent needs NumPy 2 or later, not {np.__version__}")
+
+
+class Effect:
+    """Base class for effects. Not meant to be instantiated.
+    .mix crossfades between the dry (0) and processed (1) signal.
+    .latency is how many samples the processed signal lags behind."""
+
+    def __init__(self, mix: float = 1, channels: int = 2):
+        self.mix = mix
+        self.channels = channels
+        self.enabled = True
+        self.latency = 0
+        self._dry = np.zeros((settings.chunksize, channels))
+
+    def render(self, block: np.ndarray) -> np.ndarray:
+        """Processed (fully wet) block, updating state"""
+        wet = np.array(block, dtype=np.float64)
+        self.render_into(wet)
+        return wet
+
+    def render_into(self, block: np.ndarray):
+        """Like render, processing block in place, without allocating"""
+        raise NotImplementedError
+
+    def reset(self):
+        """Forget state, like silence had been playing"""
+        raise NotImplementedError
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if not self.enabled or self.mix == 0:
+            return block
+        block = np.array(block, dtype=np.float64)
+        self.process_into(block)
+        return block
+
+    def process_into(self, block: np.ndarray):
+        """Like process, in place"""
+        if not self.enabled or self.mix == 0:
+            return
+        if self.mix == 1:
+            self.render_into(block)
+            return
+        frames = len(block)
+        if len(self._dry) < frames:
+            self._dry = np.zeros((frames, self.channels))
+        dry = np.multiply(block, 1 - self.mix, out=self._dry[:frames])
+        self.render_into(block)
+        block *= self.mix
+        block += dry
+
+
+class PartitionedConvolver:
+    """Convolves blocks with a long filter using uniformly partitioned
+    overlap-save FFT convolution. The filter is split into partitions
+    of partition_size samples whose spectra are multiplied with a delay
+    line of past input spectra, so each block costs one FFT pair no
+    matter the filter length. Blocks must be a multiple of partition_size.
+    Channels come first in the buffers, so the FFTs run over
+    contiguous memory into buffers of their own."""
+
+    def __init__(self, kernel: np.ndarray, partition_size: int, channels: int = 2):
+        kernel = np.asarray(kernel, dtype=np.float64)
+        if kernel.ndim == 1:
+            kernel = kernel[:, np.newaxis]
+        kernel = np.broadcast_to(kernel, (len(kernel), channels))
+        self.partition_size = partition_size
+        self.channels = channels
+
+        partitions = max(math.ceil(len(kernel) / partition_size), 1)
+        padded = np.zeros((partitions * partition_size, channels))
+        padded[: len(kernel)] = kernel
+        padded = padded.reshape(partitions, partition_size, channels)
+        padded = padded.transpose(0, 2, 1)
+        # oldest input is multiplied with the last partition, so reverse
+        self._spectra = np.fft.rfft(padded, n=2 * partition_size, axis=2)[::-1].copy()
+
+        bins = partition_size + 1
+        # the last two partitions of input, swapped with a spare
+        # as copying half of one into the other half would allocate
+        self._input = np.zeros((channels, 2 * partition_size))
+        self._spare_input = np.zeros((channels, 2 * partition_size))
+        # every spectrum is stored twice, so the last len(partitions)
+        # are always a contiguous slice of the ring
+        self._history = np.zeros((2 * partitions, channels, bins), dtype=complex)
+        self._head = 0
+        self._sum = np.zeros((channels, bins), dtype=complex)
+        self._output = np.zeros((channels, 2 * partition_size))
+
+    def reset(self):
+        self._input[:] = 0
+        self._history[:] = 0
+        self._head = 0
+
+    def _partition(self, samples: np.ndarray):
+        """Convolve samples in place"""
+        size = self.partition_size
+        partitions = len(self._spectra)
+        self._spare_input[:, :size] = self._input[:, size:]
+        self._spare_input[:, size:] = samples.T
+        self._input, self._spare_input = self._spare_input, self._input
+        spectrum = self._history[self._head]
+        np.fft.rfft(self._input, axis=1, out=spectrum)
+        self._history[self._head + partitions] = spectrum
+        newest = self._head + partitions
+        np.einsum(
+            "pcb,pcb->cb",
+            self._history[newest - partitions + 1 : newest + 1],
+            self._spectra,
+            out=self._sum,
+        )
+        self._head = (self._head + 1) % partitions
+        np.fft.irfft(self._sum, n=2 * size, axis=1, out=self._output)
+        samples[:] = self._output[:, size:].T
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = np.array(block, dtype=np.float64)
+        self.process_into(block)
+        return block
+
+    def process_into(self, block: np.ndarray):
+        """Like process, in place"""
+        size = self.partition_size
+        if len(block) % size:
+            raise ValueError(
+                f"Block of {len(block)} frames is not a multiple of {size}"
+            )
+        for i in range(0, len(block), size):
+            self._partition(block[i : i + size])
+
+
+class ConvolutionReverb(Effect):
+    """Reverb from an impulse response, of shape (n,) or (n, 2)"""
+
+    def __init__(
+        self,
+        impulse_response: np.ndarray,
+        mix: float = 0.25,
+        partition_size: int = 512,
+        *args,
+        **kw,
+    ):
+        super().__init__(mix, *args, **kw)
+        self.convolver = PartitionedConvolver(
+            impulse_response, partition_size, self.channels
+        )
+
+    @classmethod
+    def from_file(cls, file, samplerate=settings.samplerate, *args, **kw):
+        """Load an impulse response like a sample"""
+        import librosa  # slow to import, and only needed for files
+
+        frames, _ = librosa.core.load(file, sr=samplerate, mono=False)
+        return cls(frames.T, *args, **kw)  # librosa puts channels first
+
+    @classmethod
+    def synthetic(
+        cls,
+        length: float = 1.5,
+        samplerate=settings.samplerate,
+        seed: int = 0,
+        *args,
+        **kw,
+    ):
+        """Exponentially decaying noise, falling by 60 dB over length
+        seconds. Left and right differ to make the reverb wide."""
+        frames = round(length * samplerate)
+        decay = np.exp(np.arange(frames) * (math.log(1e-3) / frames))
+        noise = np.random.default_rng(seed).uniform(-1, 1, (frames, 2))
+        impulse_response = noise * decay[:, np.newaxis]
+        impulse_response /= np.sqrt(np.sum(impulse_response**2, axis=0))
+        return cls(impulse_response, *args, **kw)
+
+    def render_into(self, block):
+        self.convolver.process_into(block)
+
+    def reset(self):
+        self.convolver.reset()
+
+
+class FeedbackDelay(Effect):
+    """Echoes every delay_time seconds, each feedback times the last"""
+
+    def __init__(
+        self,
+        delay_time: float = 0.3,
+        feedback: float = 0.4,
+        mix: float = 0.3,
+        samplerate=settings.samplerate,
+        *args,
+        **kw,
+    ):
+        super().__init__(mix, *args, **kw)
+        self.feedback = feedback
+        self._length = max(round(delay_time * samplerate), 1)
+        self._line = np.zeros((self._length, self.channels))
+        self._swap = np.zeros((self._length, self.channels))
+        self._position = 0
+
+    def reset(self):
+        self._line[:] = 0
+        self._position = 0
+
+    def render_into(self, block):
+        done = 0
+        # samples written in this block can't be read until the next
+        # round of the line, so go in steps of at most one round
+        while done < len(block):
+            frames = min(len(block) - done, self._length - self._position)
+            line = self._line[self._position : self._position + frames]
+            echoes = self._swap[:frames]
+            echoes[:] = line
+            line *= self.feedback
+            line += block[done : done + frames]
+            block[done : done + frames] = echoes
+            done += frames
+            self._position = (self._position + frames) % self._length
+
+
+class Equalizer(Effect):
+    """Three band EQ with shelving low and high bands, as a linear
+    phase FIR filter. Delays the signal by half of taps samples."""
+
+    def __init__(
+        self,
+        low_gain: float = 0,
+        mid_gain: float = 0,
+        high_gain: float = 0,
+        low_freq: float = 250,
+        high_freq: float = 4000,
+        taps: int = 256,
+        samplerate=settings.samplerate,
+        *args,
+        **kw,
+    ):
+        """Gains are in dB, frequencies in Hz"""
+        super().__init__(1, *args, **kw)
+        freqs = np.fft.rfftfreq(taps, 1 / samplerate)
+        # smooth second order transitions between bands
+        above_low = freqs**2 / (freqs**2 + low_freq**2)
+        above_high = freqs**2 / (freqs**2 + high_freq**2)
+        gain = (
+            low_gain
+            + (mid_gain - low_gain) * above_low
+            + (high_gain - mid_gain) * above_high
+        )
+        kernel = np.fft.irfft(10 ** (gain / 20), n=taps)
+        kernel = np.roll(kernel, taps // 2) * np.hanning(taps)
+        self.convolver = PartitionedConvolver(kernel, taps, self.channels)
+        self.latency = taps // 2
+
+    def render_into(self, block):
+        self.convolver.process_into(block)
+
+    def reset(self):
+        self.convolver.reset()
+
+
+class Limiter(Effect):
+    """Lookahead peak limiter. Gain is lowered smoothly over the
+    lookahead before each peak, so the output stays under threshold
+    without clipping, and recovers at release_rate dB per second.
+    Delays the signal by lookahead seconds. .gain_reduction is the
+    largest reduction of the last block in dB, for metering."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        lookahead: float = 0.002,
+        release_rate: float = 40,
+        soft_clip: bool = True,
+        samplerate=settings.samplerate,
+        *args,
+        **kw,
+    ):
+        super().__init__(1, *args, **kw)
+        self.threshold = threshold
+        self.soft_clip = soft_clip
+        self.SOFT_CLIP_KNEE = 0.9  # fraction of threshold
+        self.latency = max(round(lookahead * samplerate), 1)
+        self._release = release_rate / samplerate  # dB per sample
+        self.gain_reduction = 0.0
+        self.reset()
+
+    def reset(self):
+        self._delayed = np.zeros((self.latency, self.channels))
+        # gain needed by the last inputs, for the lookahead windows
+        self._targets = np.ones(2 * self.latency)
+        self._frames = 0
+        self._grow(settings.chunksize)
+        self._gain = 0.0  # dB
+        self.gain_reduction = 0.0
+
+    def _grow(self, frames: int):
+        """Working buffers for blocks of up to frames, keeping
+        the delayed input and the targets in front"""
+        lookahead = self.latency
+        delayed = np.zeros((lookahead + frames, self.channels))
+        delayed[:lookahead] = self._delayed[:lookahead]
+        targets = np.ones(2 * lookahead + frames)
+        targets[: 2 * lookahead] = self._targets[: 2 * lookahead]
+        self._delayed, self._targets = delayed, targets
+        self._magnitudes = np.zeros((frames, self.channels))
+        self._over = np.zeros((frames, self.channels), dtype=bool)
+        self._held = np.zeros(lookahead + frames)
+        self._minima = np.zeros((2, 2 * lookahead + frames))
+        self._summed = np.zeros(lookahead + frames + 1)
+        self._gains = np.zeros(frames)
+        self._ramp = np.arange(frames) * self._release
+        self._frames = frames
+
+    def render_into(self, block):
+        frames, lookahead = len(block), self.latency
+        if frames > self._frames:
+            self._grow(frames)
+        delayed = self._delayed[: lookahead + frames]
+        delayed[lookahead:] = block
+
+        targets = self._targets[: 2 * lookahead + frames]
+        magnitudes = np.abs(block, out=self._magnitudes[:frames])
+        peaks = np.max(magnitudes, axis=1, out=targets[2 * lookahead :])
+        np.maximum(peaks, self.threshold, out=peaks)
+        np.divide(self.threshold, peaks, out=peaks)
+        # hold each target over the lookahead before it, then average
+        # over the lookahead again so the gain ramps down to it in time
+        held = self.window_min(targets, lookahead + 1, self._held[: lookahead + frames])
+        summed = self._summed[: lookahead + frames + 1]  # summed[0] stays 0
+        np.cumsum(held, out=summed[1:])
+        gain = self._gains[:frames]
+        np.subtract(summed[lookahead + 1 :], summed[: -lookahead - 1], out=gain)
+        gain /= lookahead + 1
+        targets[: 2 * lookahead] = targets[frames:]
+
+        # gain may rise by at most _release per sample:
+        # gain[n] = min over j <= n of smooth[j] + (n - j) * _release
+        ramp = self._ramp[:frames]
+        np.minimum(gain, 1, out=gain)
+        np.log10(gain, out=gain)
+        gain *= 20
+        gain -= ramp
+        np.minimum.accumulate(gain, out=gain)
+        np.minimum(gain, self._gain + self._release, out=gain)
+        gain += ramp
+        np.minimum(gain, 0, out=gain)
+        self._gain = float(gain[-1])
+        self.gain_reduction = -float(gain.min())
+
+        gain /= 20
+        np.power(10, gain, out=gain)
+        for channel in range(self.channels):
+            np.multiply(delayed[:frames, channel], gain, out=block[:, channel])
+        delayed[:lookahead] = delayed[frames:]
+        if self.soft_clip:
+            self.clip_into(block)
+
+    def window_min(self, values: np.ndarray, window: int, out: np.ndarray):
+        """Minimum of each run of window values, into out. Minima of runs
+        twice as long are taken from those of half as long, until just
+        under window, then two overlapping runs make up each window."""
+        minima = self._minima[:, : len(values)]
+        minima[0] = values
+        length, run = len(values), 1
+        while run * 2 <= window:
+            source, target = minima[0], minima[1]
+            np.minimum(
+                source[: length - run], source[run:length], out=target[: length - run]
+            )
+            minima = minima[::-1]
+            length -= run
+            run *= 2
+        np.minimum(
+            minima[0, : len(out)],
+            minima[0, window - run : window - run + len(out)],
+            out=out,
+        )
+        return out
+
+    def clip(self, block: np.ndarray) -> np.ndarray:
+        """Gently round off what little gets above the knee"""
+        block = np.array(block, dtype=np.float64)
+        self.clip_into(block)
+        return block
+
+    def clip_into(self, block: np.ndarray):
+        """Like clip, in place"""
+        frames = len(block)
+        if frames > self._frames:
+            self._grow(frames)
+        knee = self.SOFT_CLIP_KNEE * self.threshold
+        headroom = self.threshold - knee
+        magnitude = np.abs(block, out=self._magnitudes[:frames])
+        if magnitude.max() <= knee:
+            return
+        over = np.greater(magnitude, knee, out=self._over[:frames])
+        magnitude -= knee
+        magnitude /= headroom
+        np.tanh(magnitude, out=magnitude)
+        magnitude *= headroom
+        magnitude += knee
+        np.copysign(magnitude, block, out=magnitude)
+        np.copyto(block, magnitude, where=over)
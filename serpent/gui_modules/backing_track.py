@@ -1,14 +1,16 @@
 import copy
 import math
-import os
+import time
 
 import wx.lib.intctrl
 import wx.lib.newevent
-import wx.lib.scrolledpanel
 
 import audio
-import instruments
+import effects
+import midi
 import notes
+import presets
+import project
 
 
 def map_range(from1, from2, to1, to2, val):
@@ -72,13 +74,28 @@ class NoteInputStrip(wx.Panel):
         self.BEAT_LINES_PEN = wx.Pen(wx.Colour(130, 130, 130, 90))
         self.TEXT_FONT = wx.Font(wx.FontInfo(8))
         self.TEXT_COLOR = wx.Colour(130, 130, 130, 200)
+        self.MIN_LINE_SPACING = 3  # px, denser grid lines are skipped
+        self.PLAYHEAD_PEN = wx.Pen(wx.Colour(200, 40, 40), width=2)
+        self.PLAYHEAD_REFRESH_WIDTH = 3  # px on each side of the playhead
+        self.MOUSE_MOVE_INTERVAL = 1 / 60  # s, at most one motion update per frame
 
         super().__init__(*args, **kw, style=wx.FULL_REPAINT_ON_RESIZE)
-        self._notes: list[audio.Note] = []
+        self._index = audio.NoteIndex()
         self.time_window = (self.DEFAULT_LEFT_TIME, self.DEFAULT_RIGHT_TIME)
         self.quantize_width = self.DEFAULT_QUANTIZE_WIDTH
         self._repeat_length = self.DEFAULT_REPEAT_LENGTH
         self.tentative_note: audio.Note | None = None
+        self.dragged_note: audio.Note | None = None
+        self.drag_start_time = 0.0
+        self.last_position: wx.Point | None = None
+        self.playhead_time: float | None = None
+        self.pending_mouse_position: wx.Point | None = None
+        self.last_mouse_handled = 0.0
+        # handles motion that came too soon after the last, without spinning
+        self.mouse_move_timer = wx.Timer(self)
+        # background and grid only change with size, zoom and quantize
+        self._grid_cache: wx.Bitmap | None = None
+        self._grid_cache_key = None
 
         self.Bind(wx.EVT_PAINT, self.on_paint)
         self.Bind(wx.EVT_LEFT_DOWN, self.on_left_down)
@@ -86,6 +103,8 @@ class NoteInputStrip(wx.Panel):
         self.Bind(wx.EVT_RIGHT_DOWN, self.on_right_down)
         self.Bind(wx.EVT_MOUSEWHEEL, self.on_mouse_wheel)
         self.Bind(wx.EVT_MOTION, self.on_mouse_move)
+        self.Bind(wx.EVT_IDLE, self.on_idle)
+        self.Bind(wx.EVT_TIMER, self.on_mouse_move_timer, self.mouse_move_timer)
 
         self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
 
@@ -120,62 +139,60 @@ class NoteInputStrip(wx.Panel):
             (self.time_window[1] - self.time_window[0]) / self.ClientSize[0]
         ) * x_len
 
-    def draw_note(self, dc: wx.PaintDC, brush: wx.Brush, pen: wx.Pen, note: audio.Note):
-        dc.Brush = brush
-        dc.Pen = pen
-        dc.DrawRectangle(
+    def note_rect(self, note: audio.Note) -> wx.Rect:
+        return wx.Rect(
             x=int(self.time_to_x(note.time)),
             y=0,
             width=max(int(self.time_len_to_x_len(note.length)), 1),
             height=self.ClientSize[1],
         )
 
+    def draw_note(self, dc: wx.PaintDC, brush: wx.Brush, pen: wx.Pen, note: audio.Note):
+        dc.Brush = brush
+        dc.Pen = pen
+        dc.DrawRectangle(self.note_rect(note))
+
     def draw_notes(
         self, dc: wx.PaintDC, brush: wx.Brush, pen: wx.Pen, notes: list[audio.Note]
     ):
-        """Helper method to not have to set dc.Brush and dc.Pen repeatedly"""
-        dc.Brush = brush
-        dc.Pen = pen
-        for note in notes:
-            dc.DrawRectangle(
-                x=int(self.time_to_x(note.time)),
-                y=0,
-                width=max(int(self.time_len_to_x_len(note.length)), 1),
-                height=self.ClientSize[1],
-            )
+        """Draws all notes in one call"""
+        dc.DrawRectangleList(
+            [self.note_rect(note).Get() for note in notes], pens=pen, brushes=brush
+        )
+
+    def visible_notes(self) -> list[audio.Note]:
+        return self._index.in_range(*self.time_window)
 
     def draw_quantize_lines(self, dc: wx.PaintDC):
-        dc.Pen = self.QUANTIZE_LINES_PEN
+        if self.time_len_to_x_len(self.quantize_width) < self.MIN_LINE_SPACING:
+            return  # would fill the strip
+        lines = []
         time = self.quantize(self.time_window[0])
         while time <= self.time_window[1]:
             x = int(self.time_to_x(time))
-            dc.DrawLine(
-                x1=x,
-                y1=0,
-                x2=x,
-                y2=self.ClientSize[1],
-            )
+            lines.append((x, 0, x, self.ClientSize[1]))
             time += self.quantize_width
+        dc.DrawLineList(lines, pens=self.QUANTIZE_LINES_PEN)
 
     def draw_beat_lines(self, dc: wx.PaintDC):
-        dc.Pen = self.BEAT_LINES_PEN
         dc.Font = self.TEXT_FONT
         dc.TextForeground = self.TEXT_COLOR
+        # label every nth beat when zoomed out far
+        step = max(
+            1, math.ceil(self.MIN_LINE_SPACING / max(self.time_len_to_x_len(1), 1e-6))
+        )
+        lines, labels, label_points = [], [], []
         time = max(0, math.ceil(self.time_window[0]))
         while time < self.time_window[1]:
             x_location = int(self.time_to_x(time))
-            dc.DrawLine(
-                x1=x_location,
-                y1=0,
-                x2=x_location,
-                y2=self.ClientSize[1],
-            )
-            dc.DrawText(
-                str(time + 1),  # from zero-indexed to 1-indexed notation
-                x_location + 2,
-                self.ClientSize[1] - self.TEXT_FONT.PixelSize.y,
+            lines.append((x_location, 0, x_location, self.ClientSize[1]))
+            labels.append(str(time + 1))  # from zero-indexed to 1-indexed notation
+            label_points.append(
+                (x_location + 2, self.ClientSize[1] - self.TEXT_FONT.PixelSize.y)
             )
-            time += 1
+            time += step
+        dc.DrawLineList(lines, pens=self.BEAT_LINES_PEN)
+        dc.DrawTextList(labels, label_points)
 
     def draw_background(self, dc: wx.PaintDC):
         dc.Brush = self.BACKGROUND_BRUSH
@@ -198,15 +215,41 @@ class NoteInputStrip(wx.Panel):
                 )
             )
 
+    def draw_grid(self, dc: wx.DC):
+        """Everything drawn underneath the notes"""
+        self.draw_background(dc)
+        self.draw_quantize_lines(dc)
+        self.draw_beat_lines(dc)
+
+    def grid_cache_key(self) -> tuple:
+        return (
+            tuple(self.ClientSize),
+            self.time_window,
+            self.quantize_width,
+            self._repeat_length,
+        )
+
+    def grid_bitmap(self) -> wx.Bitmap:
+        key = self.grid_cache_key()
+        if self._grid_cache is None or key != self._grid_cache_key:
+            self._grid_cache = wx.Bitmap(
+                max(self.ClientSize[0], 1), max(self.ClientSize[1], 1)
+            )
+            dc = wx.MemoryDC(self._grid_cache)
+            self.draw_grid(dc)
+            dc.SelectObject(wx.NullBitmap)
+            self._grid_cache_key = key
+        return self._grid_cache
+
     def on_paint(self, event):
         dc = wx.BufferedPaintDC(self)
-        self.draw_background(dc)
+        dc.DrawBitmap(self.grid_bitmap(), 0, 0)
         # normal notes
         self.draw_notes(
             dc,
             self.DEFAULT_NOTES_BRUSH,
             self.DEFAULT_NOTES_PEN,
-            self._notes,
+            self.visible_notes(),
         )
         # tentative note
         if self.tentative_note is not None:
@@ -216,12 +259,57 @@ class NoteInputStrip(wx.Panel):
                 self.TENTATIVE_NOTES_PEN,
                 self.tentative_note,
             )
-        self.draw_quantize_lines(dc)
-        self.draw_beat_lines(dc)
+        self.draw_playhead(dc)
+
+    def draw_playhead(self, dc: wx.PaintDC):
+        if self.playhead_time is None:
+            return
+        dc.Pen = self.PLAYHEAD_PEN
+        x = int(self.time_to_x(self.playhead_time))
+        dc.DrawLine(x1=x, y1=0, x2=x, y2=self.ClientSize[1])
+
+    def playhead_rect(self) -> wx.Rect | None:
+        if self.playhead_time is None:
+            return None
+        return wx.Rect(
+            x=int(self.time_to_x(self.playhead_time)) - self.PLAYHEAD_REFRESH_WIDTH,
+            y=0,
+            width=2 * self.PLAYHEAD_REFRESH_WIDTH,
+            height=self.ClientSize[1],
+        )
+
+    def set_playhead(self, time: float | None):
+        """Move the playhead, repainting only the columns it left and entered"""
+        old_rect = self.playhead_rect()
+        self.playhead_time = time
+        new_rect = self.playhead_rect()
+        if old_rect == new_rect:
+            return  # hasn't moved a whole pixel
+        for rect in (old_rect, new_rect):
+            if rect is not None:
+                self.RefreshRect(rect, eraseBackground=False)
 
     def update_contents(self):
-        self.Refresh()
-        self.Update()
+        self.Refresh()  # painted when the event loop is next free
+
+    def tentative_rect(self) -> wx.Rect | None:
+        if self.tentative_note is None:
+            return None
+        return self.note_rect(self.tentative_note)
+
+    def refresh_tentative(self, old_rect: wx.Rect | None):
+        """Repaint only the area the tentative note moved across"""
+        new_rect = self.tentative_rect()
+        if old_rect is None and new_rect is None:
+            return
+        if old_rect is None:
+            dirty = new_rect
+        elif new_rect is None:
+            dirty = old_rect
+        else:
+            dirty = old_rect.Union(new_rect)
+        # pens draw just outside the rectangle
+        self.RefreshRect(dirty.Inflate(2, 2), eraseBackground=False)
 
     def zoom_to_time_window(self, window: tuple[float, float]):
         self.time_window = window
@@ -229,12 +317,11 @@ class NoteInputStrip(wx.Panel):
 
     @property
     def notes(self) -> list[audio.Note]:
-        return self._notes
+        return self._index.notes
 
     @notes.setter
     def notes(self, val: list[audio.Note]):
-        self._notes = val
-        self.validate_notes()
+        self.validate_notes(val)
         self.update_contents()
 
     @property
@@ -246,42 +333,38 @@ class NoteInputStrip(wx.Panel):
         self._repeat_length = val
         self.update_contents()
 
-    def validate_notes(self):
-        okay: list[audio.Note] = []
-        for note in self._notes:
-            should_append = True
-            for okay_note in okay:
-                if okay_note.overlaps(note):
-                    should_append = False
-            if should_append:
-                okay.append(note)
-        self._notes = okay
+    def validate_notes(self, notes: list[audio.Note]):
+        """Keep notes in order, dropping notes that overlap earlier ones"""
+        self._index = audio.NoteIndex()
+        for note in notes:
+            if not self._index.overlapping(note):
+                self._index.insert(note)
 
     def note_at(self, time: float) -> audio.Note | None:
-        """Return result not guaranteed for unvalidated ._notes"""
-        for note in self._notes:
-            if note.contains(time):
-                return note
-        return None
-
-    def note_index_at(self, time: float) -> int | None:
-        """Return result not guaranteed for unvalidated ._notes"""
-        for i in range(len(self._notes)):
-            if self._notes[i].contains(time):
-                return i
-        return None
-
-    def event(self):
-        wx.PostEvent(self.Parent, NoteStripUpdateEvent())
+        return self._index.find(time)
+
+    def event(self, edit: audio.NoteEdit | None = None):
+        """edit is None when the notes should be resynced in full"""
+        wx.PostEvent(self.Parent, NoteStripUpdateEvent(edit=edit))
 
     def add_note(self, note: audio.Note):
         """May not add notes if there is overlap"""
-        for okay_note in self._notes:
-            if okay_note.overlaps(note):
-                print("Warning: note not added because of overlap")
+        if self._index.overlapping(note):
+            print("Warning: note not added because of overlap")
+            return
+        self._index.insert(copy.copy(note))
+        self.event(audio.AddNote(copy.copy(note)))
+
+    def move_note(self, note: audio.Note, moved: audio.Note):
+        """Move note to the position of moved.
+        May not move notes if there is overlap"""
+        for okay_note in self._index.overlapping(moved):
+            if okay_note is not note:
+                print("Warning: note not moved because of overlap")
                 return
-        self._notes.append(copy.copy(note))
-        self.event()
+        self._index.pop_at_time(note.time)
+        self._index.insert(copy.copy(moved))
+        self.event(audio.MoveNote(note.time, copy.copy(moved)))
 
     def tentative_set_beginning(self, x: float):
         if self.x_to_time(x) < 0:
@@ -311,13 +394,40 @@ class NoteInputStrip(wx.Panel):
 
         self.tentative_note.length = abs(length)
 
+    def drag_set_beginning(self, note: audio.Note, x: float, y: float):
+        self.dragged_note = note
+        self.drag_start_time = self.x_to_time(x)
+
+    def drag_set_position(self, x: float, y: float):
+        if self.dragged_note is None:
+            return
+        # snap the distance moved, not the cursor, to keep the grab point
+        delta = self.x_to_time(x) - self.drag_start_time
+        self.tentative_note = copy.copy(self.dragged_note)
+        self.tentative_note.time = max(
+            0,
+            self.dragged_note.time
+            + self.quantize_width * round(delta / self.quantize_width),
+        )
+
     def on_left_down(self, event: wx.MouseEvent):
-        if self.note_at(self.x_to_time(event.Position[0])) is not None:
-            return  # don't create notes in already existing notes
+        note = self.note_at(self.x_to_time(event.Position[0]))
+        if note is not None:
+            # dragging existing notes moves them
+            self.drag_set_beginning(note, event.Position[0], event.Position[1])
+            return
         self.tentative_set_beginning(event.Position[0])
-        self.update_contents()
+        self.refresh_tentative(None)
 
     def on_left_up(self, event: wx.MouseEvent):
+        self.handle_pending_mouse_move()
+        if self.dragged_note is not None:
+            if self.tentative_note is not None:
+                self.move_note(self.dragged_note, self.tentative_note)
+            self.dragged_note = None
+            self.tentative_note = None
+            self.update_contents()
+            return
         self.tentative_set_end(event.Position[0])
         if self.tentative_note is not None:
             self.add_note(self.tentative_note)
@@ -325,6 +435,31 @@ class NoteInputStrip(wx.Panel):
         self.update_contents()
 
     def on_mouse_move(self, event: wx.MouseEvent):
+        # only remember the latest position, motion is handled when idle
+        self.pending_mouse_position = event.Position
+
+    def on_idle(self, event: wx.IdleEvent):
+        if self.pending_mouse_position is None or self.mouse_move_timer.IsRunning():
+            return
+        wait = self.last_mouse_handled + self.MOUSE_MOVE_INTERVAL - time.perf_counter()
+        if wait > 0:
+            # come back once this frame is over, sleeping until then
+            self.mouse_move_timer.StartOnce(max(1, math.ceil(wait * 1000)))
+            return
+        self.handle_pending_mouse_move()
+
+    def on_mouse_move_timer(self, event: wx.TimerEvent):
+        self.handle_pending_mouse_move()
+
+    def handle_pending_mouse_move(self):
+        if self.pending_mouse_position is None:
+            return
+        position = self.pending_mouse_position
+        self.pending_mouse_position = None
+        self.last_mouse_handled = time.perf_counter()
+        self.handle_mouse_move(position)
+
+    def handle_mouse_move(self, position: wx.Point):
         is_shift = wx.GetKeyState(wx.WXK_SHIFT)
         if is_shift:
             if self.last_position is not None:
@@ -332,15 +467,19 @@ class NoteInputStrip(wx.Panel):
                 # invert delta.x to make time window follow cursor
                 self.pan_time_window(self.x_len_to_time_len(-delta.x))
         else:
-            self.tentative_set_end(event.Position[0])
-        self.update_contents()
+            old_rect = self.tentative_rect()
+            if self.dragged_note is not None:
+                self.drag_set_position(position[0], position[1])
+            else:
+                self.tentative_set_end(position[0])
+            self.refresh_tentative(old_rect)
         self.last_position = wx.GetMousePosition()
 
     def on_right_down(self, event: wx.MouseEvent):
-        note_index = self.note_index_at(self.x_to_time(event.Position[0]))
-        if note_index is not None:
-            self._notes.pop(note_index)
-        self.event()
+        note = self.note_at(self.x_to_time(event.Position[0]))
+        if note is not None:
+            self._index.pop_at_time(note.time)
+            self.event(audio.RemoveNote(note.time))
         self.update_contents()
 
     def pan_time_window(self, time_amount: float):
@@ -422,84 +561,60 @@ class PitchedNoteInputStrip(NoteInputStrip):
             self.ClientSize[1] / (self.pitch_window[1] - self.pitch_window[0])
         )
 
-    def draw_note(
-        self, dc: wx.PaintDC, brush: wx.Brush, pen: wx.Pen, note: audio.PitchedNote
-    ):
-        dc.Brush = brush
-        dc.Pen = pen
-        dc.DrawRectangle(
+    def note_rect(self, note: audio.PitchedNote) -> wx.Rect:
+        return wx.Rect(
             x=int(self.time_to_x(note.time)),
             y=int(self.pitch_to_y(note.pitch)),
             width=max(int(self.time_len_to_x_len(note.length)), 1),
             height=self.pitch_width_y,
         )
 
-    def draw_notes(
-        self,
-        dc: wx.PaintDC,
-        brush: wx.Brush,
-        pen: wx.Pen,
-        notes: list[audio.PitchedNote],
-    ):
-        """Helper method to not have to set dc.Brush and dc.Pen repeatedly"""
-        dc.Brush = brush
-        dc.Pen = pen
-        for note in notes:
-            dc.DrawRectangle(
-                x=int(self.time_to_x(note.time)),
-                y=int(self.pitch_to_y(note.pitch)),
-                width=max(int(self.time_len_to_x_len(note.length)), 1),
-                height=self.pitch_width_y,
-            )
+    # inherit .draw_note
+
+    # inherit .draw_notes
+
+    def visible_notes(self) -> list[audio.PitchedNote]:
+        return [
+            note
+            for note in super().visible_notes()
+            if self.pitch_window[0] <= note.pitch <= self.pitch_window[1]
+        ]
 
     # inherit .draw_quantize_lines
 
     def draw_pitch_lines(self, dc: wx.PaintDC):
-        dc.Pen = self.PITCH_LINES_PEN
         text_location_x = int(max(0, self.time_to_x(0))) + 2
         dc.Font = self.TEXT_FONT
         dc.TextForeground = self.TEXT_COLOR
 
+        lines, labels, label_points = [], [], []
         pitch = max(self.pitch_window[0], 0)
         while pitch <= self.pitch_window[1]:
-            dc.DrawLine(
-                x1=0,
-                y1=int(self.pitch_to_y(pitch)),
-                x2=self.ClientSize[0],  # width
-                y2=int(self.pitch_to_y(pitch)),
-            )
-            dc.DrawText(
-                notes.str_from_midi_index(pitch),
-                x=text_location_x,
-                y=int(self.pitch_to_y(pitch)),
-            )
+            y = int(self.pitch_to_y(pitch))
+            lines.append((0, y, self.ClientSize[0], y))
+            labels.append(notes.str_from_midi_index(pitch))
+            label_points.append((text_location_x, y))
             pitch += 1
+        dc.DrawLineList(lines, pens=self.PITCH_LINES_PEN)
+        dc.DrawTextList(labels, label_points)
 
     # inherit .draw_background
 
-    def on_paint(self, event):
-        self.pitch_width_y_update()
-        dc = wx.BufferedPaintDC(self)
+    def draw_grid(self, dc: wx.DC):
         self.draw_background(dc)
-        # normal notes
-        self.draw_notes(
-            dc,
-            self.DEFAULT_NOTES_BRUSH,
-            self.DEFAULT_NOTES_PEN,
-            self._notes,
-        )
-        # tentative note
-        if self.tentative_note is not None:
-            self.draw_note(
-                dc,
-                self.TENTATIVE_NOTES_BRUSH,
-                self.TENTATIVE_NOTES_PEN,
-                self.tentative_note,
-            )
         self.draw_quantize_lines(dc)
         self.draw_pitch_lines(dc)
         self.draw_beat_lines(dc)
 
+    def grid_cache_key(self) -> tuple:
+        return super().grid_cache_key() + (self.pitch_window,)
+
+    # inherit .grid_bitmap
+
+    def on_paint(self, event):
+        self.pitch_width_y_update()
+        super().on_paint(event)
+
     # inherit .update_contents
 
     def zoom_to_pitch_window(self, pitch_window: tuple[int, int]):
@@ -533,8 +648,6 @@ class PitchedNoteInputStrip(NoteInputStrip):
 
     # inherit .note_at
 
-    # inherit .note_index_at
-
     # inherit .add_note
 
     def tentative_set_beginning(self, x: float, y: float):
@@ -550,15 +663,30 @@ class PitchedNoteInputStrip(NoteInputStrip):
 
     # inherit .tentative_set_end
 
+    def drag_set_beginning(self, note: audio.PitchedNote, x: float, y: float):
+        super().drag_set_beginning(note, x, y)
+        self.drag_start_pitch = self.y_to_pitch(y)
+
+    def drag_set_position(self, x: float, y: float):
+        super().drag_set_position(x, y)
+        if self.tentative_note is None:
+            return
+        self.tentative_note.pitch = self.dragged_note.pitch + (
+            self.y_to_pitch(y) - self.drag_start_pitch
+        )
+
     def on_left_down(self, event: wx.MouseEvent):
-        if self.note_at(self.x_to_time(event.Position[0])) is not None:
-            return  # don't create notes in already existing notes
+        note = self.note_at(self.x_to_time(event.Position[0]))
+        if note is not None:
+            # dragging existing notes moves them
+            self.drag_set_beginning(note, event.Position[0], event.Position[1])
+            return
         self.tentative_set_beginning(event.Position[0], event.Position[1])
-        self.update_contents()
+        self.refresh_tentative(None)
 
     # inherit .on_left_up
 
-    def on_mouse_move(self, event: wx.MouseEvent):
+    def handle_mouse_move(self, position: wx.Point):
         is_shift = wx.GetKeyState(wx.WXK_SHIFT)
         if is_shift:
             if self.last_position is not None:
@@ -575,10 +703,20 @@ class PitchedNoteInputStrip(NoteInputStrip):
                     self.pan_pitch_window(pitch_move)
                     self.delta_y_accumulate = 0
         else:  # not shift
-            self.tentative_set_end(event.Position[0])
-        self.update_contents()
+            old_rect = self.tentative_rect()
+            if self.dragged_note is not None:
+                self.drag_set_position(position[0], position[1])
+            else:
+                self.tentative_set_end(position[0])
+            self.refresh_tentative(old_rect)
         self.last_position = wx.GetMousePosition()
 
+    # inherit .on_mouse_move
+
+    # inherit .on_idle
+
+    # inherit .handle_pending_mouse_move
+
     # inherit .on_right_down
 
     def zoom_time_by_factor(self, factor: float):
@@ -612,14 +750,43 @@ class PitchedNoteInputStrip(NoteInputStrip):
 VoiceEditorDestroyEvent, EVT_VOICE_EDITOR_DESTROY = wx.lib.newevent.NewEvent()
 
 
+class VoiceEditorState:
+    """What a VoiceEditor shows for a voice, kept while
+    the voice is scrolled out of view"""
+
+    def __init__(
+        self,
+        quantize: tuple[int, int],
+        repeat_length: int,
+        amplitude: int,
+        time_window: tuple[float, float],
+        pitch_window: tuple[int, int] | None,
+        notes: list[audio.Note],
+    ):
+        self.quantize = quantize
+        self.repeat_length = repeat_length
+        self.amplitude = amplitude
+        self.time_window = time_window
+        self.pitch_window = pitch_window
+        self.notes = notes
+
+
 class VoiceEditor(wx.Panel):
     """Note: takes ownership of voice given to this control.
-    .voice should not be changed once given."""
+    .voice should only be changed through .load()"""
 
-    def __init__(self, voice: audio.Voice, name: str = "Unnamed Voice", *args, **kw):  # type: ignore
+    def __init__(
+        self,
+        voice: audio.Voice,
+        name: str = "Unnamed Voice",
+        *args,
+        state: VoiceEditorState | None = None,
+        **kw,
+    ):  # type: ignore
         super().__init__(*args, **kw)
         self.DEFAULT_QUANTIZE_TOP, self.DEFAULT_QUANTIZE_BOTTOM = 1, 2
         PLACEHOLDER_REPEAT_LENGTH = 4
+        self.PLACEHOLDER_REPEAT_LENGTH = PLACEHOLDER_REPEAT_LENGTH
 
         self.name = name
         self._voice = voice
@@ -657,6 +824,18 @@ class VoiceEditor(wx.Panel):
             name="amplitude_slider",
             size=wx.Size(200, 30),
         )
+        self.pan_slider = wx.Slider(
+            self,
+            value=0,
+            minValue=-100,
+            maxValue=100,
+            name="pan_slider",
+            size=wx.Size(100, 30),
+        )
+        self.mute_checkbox = wx.CheckBox(self, label="Mute")
+        self.solo_checkbox = wx.CheckBox(self, label="Solo")
+        # play from a prerendered loop until the notes are edited
+        self.freeze_checkbox = wx.CheckBox(self, label="Freeze")
 
         self.time_window_left_field = wx.lib.intctrl.IntCtrl(
             self, value=1, size=wx.Size(40, 30)
@@ -674,7 +853,77 @@ class VoiceEditor(wx.Panel):
 
         self.init_gui()
         self.init_bindings()
-        self.sync_all()
+        self.load(voice, name, state)
+
+    @property
+    def voice(self) -> audio.Voice:
+        return self._voice
+
+    def default_state(self) -> VoiceEditorState:
+        return VoiceEditorState(
+            quantize=(self.DEFAULT_QUANTIZE_TOP, self.DEFAULT_QUANTIZE_BOTTOM),
+            repeat_length=self.PLACEHOLDER_REPEAT_LENGTH,
+            amplitude=self.amplitude_slider.Max,
+            time_window=(
+                self.input_strip.DEFAULT_LEFT_TIME,
+                self.input_strip.DEFAULT_RIGHT_TIME,
+            ),
+            pitch_window=None,
+            notes=[],
+        )
+
+    def save_state(self) -> VoiceEditorState:
+        return VoiceEditorState(
+            quantize=(self.quantize_top_field.Value, self.quantize_bottom_field.Value),
+            repeat_length=self.repeat_length_field.Value,
+            amplitude=self.amplitude_slider.Value,
+            time_window=self.input_strip.time_window,
+            pitch_window=getattr(self.input_strip, "pitch_window", None),
+            notes=self.input_strip.notes,
+        )
+
+    def load(
+        self, voice: audio.Voice, name: str, state: VoiceEditorState | None = None
+    ):
+        """Show voice in this editor, restoring state if it was shown
+        before. Without state, the default fields are pushed to voice."""
+        self.name = name
+        self._voice = voice
+        self.name_label.Label = name
+
+        fresh = state is None
+        if fresh:
+            state = self.default_state()
+
+        # ChangeValue doesn't send EVT_TEXT, so nothing is pushed to voice yet
+        self.quantize_top_field.ChangeValue(state.quantize[0])
+        self.quantize_bottom_field.ChangeValue(state.quantize[1])
+        self.repeat_length_field.ChangeValue(state.repeat_length)
+        self.amplitude_slider.Value = state.amplitude
+        # mixer settings are kept by the voice
+        self.pan_slider.Value = round(voice.channel.pan * self.pan_slider.Max)
+        self.mute_checkbox.Value = voice.channel.mute
+        self.solo_checkbox.Value = voice.channel.solo
+        self.freeze_checkbox.Value = voice.freeze
+        self.update_quantize()
+        self.input_strip.repeat_length = state.repeat_length
+        self.input_strip.notes = state.notes
+        if isinstance(self.input_strip, PitchedNoteInputStrip):
+            self.input_strip.zoom_to_windows(
+                state.time_window,
+                state.pitch_window
+                or (
+                    self.input_strip.DEFAULT_PITCH_WINDOW_LOWER,
+                    self.input_strip.DEFAULT_PITCH_WINDOW_HIGHER,
+                ),
+            )
+        else:
+            self.input_strip.zoom_to_time_window(state.time_window)
+        self.update_time_window_from_strip(None)
+        self.input_strip.set_playhead(None)
+
+        if fresh:
+            self.sync_all()
 
     def init_gui(self):
         self.vbox = wx.BoxSizer(wx.VERTICAL)
@@ -696,6 +945,12 @@ class VoiceEditor(wx.Panel):
         self.hbox.Add(wx.Size(15, 0))
         self.hbox.Add(self.amplitude_slider, flag=wx.CENTER)
         self.hbox.Add(wx.Size(15, 0))
+        self.hbox.Add(wx.StaticText(self, label="Pan: "), flag=wx.CENTER)
+        self.hbox.Add(self.pan_slider, flag=wx.CENTER)
+        self.hbox.Add(self.mute_checkbox, flag=wx.CENTER)
+        self.hbox.Add(self.solo_checkbox, flag=wx.CENTER)
+        self.hbox.Add(self.freeze_checkbox, flag=wx.CENTER)
+        self.hbox.Add(wx.Size(15, 0))
         self.hbox.Add(wx.StaticText(self, label="Time window: "), flag=wx.CENTER)
         self.hbox.Add(self.time_window_left_field)
         self.hbox.Add(wx.StaticText(self, label=" to "), flag=wx.CENTER)
@@ -709,6 +964,7 @@ class VoiceEditor(wx.Panel):
         self.Bind(wx.EVT_TEXT, self.on_text)
         self.Bind(EVT_NOTE_STRIP_UPDATE, self.on_notes)
         self.Bind(wx.EVT_SCROLL, self.on_scroll)
+        self.Bind(wx.EVT_CHECKBOX, self.on_checkbox)
         self.Bind(EVT_NOTE_STRIP_TIME_SCROLL, self.update_time_window_from_strip)
         self.quantize_top_field.Bind(wx.EVT_CONTEXT_MENU, do_nothing)
         self.quantize_bottom_field.Bind(wx.EVT_CONTEXT_MENU, do_nothing)
@@ -725,13 +981,40 @@ class VoiceEditor(wx.Panel):
         self.update_time_window()
 
     def on_scroll(self, event: wx.ScrollEvent):
-        self.update_amplitude()
+        if event.EventObject == self.pan_slider:
+            self.update_pan()
+        else:
+            self.update_amplitude()
+
+    def on_checkbox(self, event: wx.Event):
+        if event.EventObject == self.freeze_checkbox:
+            self.update_freeze()
+        else:
+            self.update_mute_solo()
 
     def on_notes(self, event: wx.Event):
-        self.update_voice_notes()
+        if event.edit is None:
+            self.update_voice_notes()
+        else:
+            # the voice is passed along, as this editor may be reused
+            # for another voice before the audio thread gets to it
+            self._voice.post(
+                VoiceEditor.apply_edit, self.Parent, self._voice, event.edit
+            )
+            self.freeze_checkbox.Value = False  # edits unfreeze the voice
+
+    @staticmethod
+    def apply_edit(voice_list: "VoiceList", voice: audio.Voice, edit: audio.NoteEdit):
+        """Run on the audio thread. An edit that doesn't apply means the
+        voice's notes went out of step with the strip's, so those are
+        sent again from the GUI thread."""
+        try:
+            voice.apply_edit(edit)
+        except ValueError:
+            wx.CallAfter(voice_list.update_voice_notes, voice)
 
     def on_close(self):
-        event = VoiceEditorDestroyEvent(obj=self)
+        event = VoiceEditorDestroyEvent(obj=self, voice=self._voice)
         wx.PostEvent(self.Parent.Parent, event)
 
     def update_quantize(self):
@@ -746,10 +1029,35 @@ class VoiceEditor(wx.Panel):
         if self.repeat_length_field.Value <= 0:
             return
         self.input_strip.repeat_length = self.repeat_length_field.Value
-        self._voice.repeat_length = self.repeat_length_field.Value
+        self._voice.post(
+            setattr, self._voice, "repeat_length", self.repeat_length_field.Value
+        )
 
     def update_amplitude(self):
-        self._voice.amplitude = self.amplitude_slider.Value / self.amplitude_slider.Max
+        self._voice.post(
+            setattr,
+            self._voice,
+            "amplitude",
+            self.amplitude_slider.Value / self.amplitude_slider.Max,
+        )
+
+    def update_pan(self):
+        self._voice.post(
+            setattr,
+            self._voice.channel,
+            "pan",
+            self.pan_slider.Value / self.pan_slider.Max,
+        )
+
+    def update_mute_solo(self):
+        self._voice.post(setattr, self._voice.channel, "mute", self.mute_checkbox.Value)
+        self._voice.post(setattr, self._voice.channel, "solo", self.solo_checkbox.Value)
+
+    def update_freeze(self):
+        if self.freeze_checkbox.Value:
+            self._voice.post(setattr, self._voice, "freeze", True)
+        else:
+            self._voice.post(self._voice.unfreeze)
 
     def update_time_window(self):
         if self.time_window_left_field.Value > self.time_window_right_field.Value:
@@ -782,7 +1090,11 @@ class VoiceEditor(wx.Panel):
         )
 
     def update_voice_notes(self):
-        self._voice.notes = copy.deepcopy(self.input_strip.notes)
+        # indexed here, sorting and checking every note, so the
+        # audio thread only swaps the index in
+        index = audio.NoteIndex(copy.deepcopy(self.input_strip.notes))
+        self._voice.post(setattr, self._voice, "notes", index)
+        self.freeze_checkbox.Value = False
 
     def sync_all(self):
         self.update_quantize()
@@ -792,126 +1104,199 @@ class VoiceEditor(wx.Panel):
         self.update_voice_notes()
 
 
-class VoiceEntry:
-    """.voice should not be changed once initialized"""
+class VoiceList(wx.ScrolledWindow):
+    """Scrolling list of voices that only has VoiceEditors for the
+    voices in view. Off-screen voices are painted as plain rows,
+    and editors scrolled out of view are pooled to be reused."""
 
-    def __init__(self, voice: audio.Voice, name: str):
-        self._voice = voice
-        self._name = name
+    class Entry:
+        def __init__(self, voice: audio.Voice, name: str, height: int):
+            self.voice = voice
+            self.name = name
+            self.height = height
+            self.state: VoiceEditorState | None = None
+            self.editor: VoiceEditor | None = None
+
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.SIZE_NOTE_STRIP, self.SIZE_PITCHED_NOTE_STRIP = 100, 400
+        self.BORDER = 1
+        self.SCROLL_RATE = 20
+        self.POOL_SIZE = 2  # spare editors of each kind kept for reuse
+        self.ROW_BRUSH = wx.Brush(wx.Colour(190, 190, 190))
+        self.ROW_PEN = wx.Pen(wx.Colour(140, 140, 140), width=1)
+        self.TEXT_FONT = wx.Font(wx.FontInfo(10))
+
+        self._entries: list[VoiceList.Entry] = []
+        self._pool: dict[bool, list[VoiceEditor]] = {False: [], True: []}
+
+        self.SetScrollRate(0, self.SCROLL_RATE)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.Bind(wx.EVT_PAINT, self.on_paint)
+        self.Bind(wx.EVT_SIZE, self.on_size)
+        self.Bind(wx.EVT_SCROLLWIN, self.on_scroll)
 
     @property
-    def voice(self) -> audio.Voice:
-        return copy.deepcopy(self._voice)
+    def editors(self) -> list[VoiceEditor]:
+        """Editors of the voices in view"""
+        return [entry.editor for entry in self._entries if entry.editor is not None]
 
     @property
-    def name(self) -> str:
-        return self._name
+    def voices(self) -> list[audio.Voice]:
+        return [entry.voice for entry in self._entries]
 
+    def add_voice(
+        self, voice: audio.Voice, name: str, state: VoiceEditorState | None = None
+    ):
+        """Without state, the voice is set up like a new VoiceEditor would"""
+        height = self.SIZE_PITCHED_NOTE_STRIP if voice.pitched else self.SIZE_NOTE_STRIP
+        entry = VoiceList.Entry(voice, name, height)
+        entry.state = state
+        self._entries.append(entry)
+        self.update_layout()
+
+    def snapshot(self) -> list[tuple[audio.Voice, str, VoiceEditorState]]:
+        """(voice, name, editor state) of every voice"""
+        result = []
+        for entry in self._entries:
+            if entry.editor is not None:
+                state = entry.editor.save_state()
+            elif entry.state is not None:
+                state = entry.state
+            else:  # never shown, so the voice itself is up to date
+                state = VoiceEditorState(
+                    quantize=(1, 2),
+                    repeat_length=entry.voice.repeat_length,
+                    amplitude=round(entry.voice.amplitude * 100),
+                    time_window=(0, entry.voice.repeat_length),
+                    pitch_window=None,
+                    notes=list(entry.voice.notes),
+                )
+            result.append((entry.voice, entry.name, state))
+        return result
+
+    def update_voice_notes(self, voice: audio.Voice):
+        """Send voice the notes shown for it, if it is still listed"""
+        for entry in self._entries:
+            if entry.voice is voice:
+                if entry.editor is not None:
+                    entry.editor.update_voice_notes()
+                elif entry.state is not None:
+                    index = audio.NoteIndex(copy.deepcopy(entry.state.notes))
+                    voice.post(setattr, voice, "notes", index)
+                break
+
+    def remove_voice(self, voice: audio.Voice):
+        for entry in self._entries:
+            if entry.voice is voice:
+                if entry.editor is not None:
+                    self.release(entry)
+                self._entries.remove(entry)
+                break
+        self.update_layout()
+
+    def row_spans(self):
+        """(entry, top, bottom) for each entry, in unscrolled coordinates"""
+        top = 0
+        for entry in self._entries:
+            bottom = top + entry.height + 2 * self.BORDER
+            yield entry, top, bottom
+            top = bottom
+
+    def view_span(self) -> tuple[int, int]:
+        top = self.GetViewStart()[1] * self.SCROLL_RATE
+        return top, top + self.ClientSize[1]
+
+    def update_layout(self):
+        height = sum(entry.height + 2 * self.BORDER for entry in self._entries)
+        self.SetVirtualSize(self.ClientSize[0], height)
+        self.update_visible()
+        self.Refresh()
 
-# helper method
-def list_files(path):
-    return [os.path.join(path, file) for file in os.listdir(path)]
+    def update_visible(self):
+        view_top, view_bottom = self.view_span()
+        for entry, top, bottom in self.row_spans():
+            visible = top < view_bottom and bottom > view_top
+            if visible and entry.editor is None:
+                self.acquire(entry)
+            elif not visible and entry.editor is not None:
+                self.release(entry)
+            if entry.editor is not None:
+                entry.editor.SetSize(
+                    wx.Rect(
+                        self.CalcScrolledPosition(self.BORDER, top + self.BORDER),
+                        wx.Size(self.ClientSize[0] - 2 * self.BORDER, entry.height),
+                    )
+                )
 
+    def acquire(self, entry: "VoiceList.Entry"):
+        pool = self._pool[entry.voice.pitched]
+        if pool:
+            entry.editor = pool.pop()
+            entry.editor.load(entry.voice, entry.name, entry.state)
+            entry.editor.Show()
+        else:
+            entry.editor = VoiceEditor(entry.voice, entry.name, self, state=entry.state)
+
+    def release(self, entry: "VoiceList.Entry"):
+        entry.state = entry.editor.save_state()
+        pool = self._pool[entry.voice.pitched]
+        if len(pool) < self.POOL_SIZE:
+            entry.editor.Hide()
+            pool.append(entry.editor)
+        else:
+            entry.editor.Destroy()
+        entry.editor = None
 
-DEFAULT_VOICE_SET = [
-    VoiceEntry(
-        audio.Voice(audio.ADSR(instruments.Harmonics()), [], 4, 4, True),
-        "Synthesizer 1",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/ride_a")),
-                release_len=2,
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Ride cymbal A",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/ride_b")),
-                release_len=2,
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Ride cymbal B",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/hihat")),
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Hi-hat",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/snare")),
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Snare drum",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/tom")),
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Toms",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/crash")), release_len=2.5
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Crash cymbals",
-    ),
-    VoiceEntry(
-        audio.Voice(
-            audio.ADSR(
-                instruments.RoundRobin(list_files("samples/drumstick")),
-            ),
-            [],
-            4,
-            4,
-        ),
-        "Drumstick",
-    ),
-]
+    def on_paint(self, event):
+        dc = wx.AutoBufferedPaintDC(self)
+        self.DoPrepareDC(dc)
+        view_top, view_bottom = self.view_span()
+        dc.Background = wx.Brush(self.BackgroundColour)
+        dc.Clear()
+        dc.Brush = self.ROW_BRUSH
+        dc.Pen = self.ROW_PEN
+        dc.Font = self.TEXT_FONT
+        # rows with editors are covered by them
+        for entry, top, bottom in self.row_spans():
+            if entry.editor is None and top < view_bottom and bottom > view_top:
+                dc.DrawRectangle(
+                    x=self.BORDER,
+                    y=top + self.BORDER,
+                    width=self.ClientSize[0] - 2 * self.BORDER,
+                    height=entry.height,
+                )
+                dc.DrawText(entry.name, self.BORDER + 5, top + self.BORDER + 5)
+
+    def on_size(self, event: wx.SizeEvent):
+        self.update_layout()
+        event.Skip()
+
+    def on_scroll(self, event: wx.ScrollWinEvent):
+        event.Skip()
+        # positions are only updated after the event is handled
+        wx.CallAfter(self.update_visible)
 
 
 class BackingTrack(wx.Panel):
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
         self.title = "Backing Track"
-        self.SIZE_NOTE_STRIP, self.SIZE_PITCHED_NOTE_STRIP = 100, 400
         self.DEFAULT_BPM = 130
         self.BPM_MIN, self.BPM_MAX = 1, 1000
         self.BPM_INITIAL = 130
         self.BPM_INCREMENT = 5
+        self.RAMP_BEATS_MIN, self.RAMP_BEATS_MAX = 1, 1024
+        self.RAMP_BEATS_INITIAL = 32
+        self.PLAYHEAD_INTERVAL = 16  # ms, about once per frame
+        self.METER_RANGE = 12  # dB of gain reduction shown
+        self.PROJECT_WILDCARD = "Serpent projects (*.serpent)|*.serpent"
+        self.MIDI_WILDCARD = "MIDI files (*.mid;*.midi)|*.mid;*.midi"
 
         self.new_voice_dropdown = wx.Choice(
-            self, name="new_voice_dropdown", choices=[x.name for x in DEFAULT_VOICE_SET]
+            self,
+            name="new_voice_dropdown",
+            choices=[x.name for x in presets.DEFAULT_VOICE_SET],
         )
         self.new_voice_dropdown.Selection = 0
         self.new_voice_button = wx.Button(
@@ -925,17 +1310,58 @@ class BackingTrack(wx.Panel):
             name="bpm_control",
             size=wx.Size(150, 30),
         )
-        self.play_button = wx.Button(self, label="Play/Stop", name="play_button")
-        self.voices_window = wx.lib.scrolledpanel.ScrolledPanel(
+        # accelerando practice: move the tempo to ramp_bpm_field over some beats
+        self.ramp_bpm_field = wx.SpinCtrl(
             self,
-            name="voices_window",
+            min=self.BPM_MIN,
+            max=self.BPM_MAX,
+            initial=self.BPM_INITIAL + self.BPM_INCREMENT,
+            name="ramp_bpm_control",
+            size=wx.Size(100, 30),
         )
+        self.ramp_beats_field = wx.SpinCtrl(
+            self,
+            min=self.RAMP_BEATS_MIN,
+            max=self.RAMP_BEATS_MAX,
+            initial=self.RAMP_BEATS_INITIAL,
+            name="ramp_beats_control",
+            size=wx.Size(100, 30),
+        )
+        self.ramp_button = wx.Button(self, label="Ramp", name="ramp_button")
+        self.reverb_slider = wx.Slider(
+            self,
+            value=0,
+            minValue=0,
+            maxValue=100,
+            name="reverb_slider",
+            size=wx.Size(100, 30),
+        )
+        self.gain_reduction_meter = wx.Gauge(
+            self, range=self.METER_RANGE, size=wx.Size(60, 15)
+        )
+        # play every voice from prerendered loops while the tempo holds,
+        # not just those frozen in their voice editors
+        self.freeze_checkbox = wx.CheckBox(self, label="Freeze all")
+        self.freeze_checkbox.Value = True
+        self.play_button = wx.Button(self, label="Play/Stop", name="play_button")
+        self.open_button = wx.Button(self, label="Open...", name="open_button")
+        self.save_button = wx.Button(self, label="Save...", name="save_button")
+        self.import_button = wx.Button(self, label="Import MIDI...")
+        self.export_button = wx.Button(self, label="Export MIDI...")
+        self.voices_window = VoiceList(self, name="voices_window")
 
-        self._voice_editors = []
         self.selected_voice_index = 0
 
         self.synced_voices = audio.SyncedVoices(voices=[], bpm=self.DEFAULT_BPM)
+        self.reverb = effects.ConvolutionReverb.synthetic(mix=0)
+        self.synced_voices.bus.effects.append(self.reverb)
+        # keeps summed voices from clipping, last so it sees everything
+        self.limiter = effects.Limiter()
+        self.synced_voices.bus.effects.append(self.limiter)
+        self.synced_voices.freeze = self.freeze_checkbox.Value
         self.player = audio.Player(self.synced_voices)
+        # one timer moves the playheads of every voice editor
+        self.playhead_timer = wx.Timer(self)
 
         self.init_gui()
         self.init_bindings()
@@ -950,48 +1376,69 @@ class BackingTrack(wx.Panel):
         self.hbox.Add(50, 0)
         self.hbox.Add(wx.StaticText(self, label="BPM:"), flag=wx.CENTER)
         self.hbox.Add(self.bpm_field)
+        self.hbox.Add(wx.StaticText(self, label=" to "), flag=wx.CENTER)
+        self.hbox.Add(self.ramp_bpm_field)
+        self.hbox.Add(wx.StaticText(self, label=" over beats: "), flag=wx.CENTER)
+        self.hbox.Add(self.ramp_beats_field)
+        self.hbox.Add(self.ramp_button)
+        self.hbox.Add(50, 0)
+        self.hbox.Add(wx.StaticText(self, label="Reverb: "), flag=wx.CENTER)
+        self.hbox.Add(self.reverb_slider, flag=wx.CENTER)
+        self.hbox.Add(wx.StaticText(self, label=" Limiting: "), flag=wx.CENTER)
+        self.hbox.Add(self.gain_reduction_meter, flag=wx.CENTER)
+        self.hbox.Add(15, 0)
+        self.hbox.Add(self.freeze_checkbox, flag=wx.CENTER)
         self.hbox.Add(50, 0)
         self.hbox.Add(self.play_button, proportion=1)
-        self.voices_window.Sizer = wx.BoxSizer(wx.VERTICAL)
-        self.voices_window.SetupScrolling()
+        self.hbox.Add(50, 0)
+        self.hbox.Add(self.open_button)
+        self.hbox.Add(self.save_button)
+        self.hbox.Add(self.import_button)
+        self.hbox.Add(self.export_button)
 
     def init_bindings(self):
         self.Bind(EVT_VOICE_EDITOR_DESTROY, self.on_voice_destroy_event)
         self.Bind(wx.EVT_BUTTON, self.on_button)
         self.Bind(wx.EVT_SPINCTRL, self.on_spin_ctrl)
+        self.freeze_checkbox.Bind(wx.EVT_CHECKBOX, self.on_freeze_checkbox)
+        self.Bind(wx.EVT_TIMER, self.on_playhead_timer, self.playhead_timer)
+        self.reverb_slider.Bind(wx.EVT_SLIDER, self.on_reverb_slider)
+        self.playhead_timer.Start(self.PLAYHEAD_INTERVAL)
 
     def add_new_voice(self, index: int):
-        new_voice = DEFAULT_VOICE_SET[index].voice
-        new_voice_editor = VoiceEditor(
-            new_voice, DEFAULT_VOICE_SET[index].name, self.voices_window
-        )
-        new_voice_editor.MinSize = wx.Size(
-            0,
-            self.SIZE_PITCHED_NOTE_STRIP if new_voice.pitched else self.SIZE_NOTE_STRIP,
-        )
-        self.voices_window.Sizer.Add(
-            new_voice_editor, proportion=0, flag=wx.EXPAND | wx.ALL, border=1
-        )
-        self.voices_window.Layout()
-
-        self._voice_editors.append(new_voice_editor)
-        self.synced_voices.voices.append(new_voice)
-        self.synced_voices.sync_bpm()
+        new_voice = presets.DEFAULT_VOICE_SET[index].voice
+        self.voices_window.add_voice(new_voice, presets.DEFAULT_VOICE_SET[index].name)
+        self.synced_voices.add_voice(new_voice)
 
     def on_voice_destroy_event(self, event: wx.Event):
-        self._voice_editors.remove(event.obj)
-        self.synced_voices.voices.remove(event.obj._voice)
-        event.obj.Destroy()
-        self.voices_window.Layout()
+        self.voices_window.remove_voice(event.voice)
+        self.synced_voices.remove_voice(event.voice)
 
     def on_button(self, event: wx.Event):
         if event.EventObject == self.new_voice_button:
             self.new_voice_pressed()
         elif event.EventObject == self.play_button:
             self.play_button_pressed()
+        elif event.EventObject == self.ramp_button:
+            self.ramp_button_pressed()
+        elif event.EventObject == self.open_button:
+            self.open_button_pressed()
+        elif event.EventObject == self.save_button:
+            self.save_button_pressed()
+        elif event.EventObject == self.import_button:
+            self.import_button_pressed()
+        elif event.EventObject == self.export_button:
+            self.export_button_pressed()
 
     def on_spin_ctrl(self, event: wx.Event):
-        self.update_bpm()
+        if event.EventObject == self.bpm_field:
+            self.update_bpm()
+
+    def ramp_button_pressed(self):
+        self.synced_voices.ramp_bpm(
+            self.ramp_bpm_field.Value, self.ramp_beats_field.Value
+        )
+        self.bpm_field.Value = self.ramp_bpm_field.Value
 
     def new_voice_pressed(self):
         if self.new_voice_dropdown.Selection == wx.NOT_FOUND:
@@ -999,8 +1446,187 @@ class BackingTrack(wx.Panel):
         self.add_new_voice(self.new_voice_dropdown.Selection)
 
     def play_button_pressed(self):
+        self.synced_voices.post(self.toggle_playback)
+
+    def toggle_playback(self):
+        """Runs on the audio thread"""
         self.synced_voices.enabled = not self.synced_voices.enabled
         self.synced_voices.rewind()
 
+    def ask_path(self, message: str, wildcard: str, save: bool) -> str | None:
+        style = (
+            wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT
+            if save
+            else wx.FD_OPEN | wx.FD_FILE_MUST_EXIST
+        )
+        with wx.FileDialog(self, message, wildcard=wildcard, style=style) as dialog:
+            if dialog.ShowModal() == wx.ID_CANCEL:
+                return None
+            return dialog.Path
+
+    def open_button_pressed(self):
+        path = self.ask_path("Open project", self.PROJECT_WILDCARD, save=False)
+        if path is None:
+            return
+        try:
+            self.load_project(path)
+        except (OSError, ValueError) as e:
+            wx.LogError(f"Could not open {path}: {e}")
+
+    def save_button_pressed(self):
+        path = self.ask_path("Save project", self.PROJECT_WILDCARD, save=True)
+        if path is None:
+            return
+        try:
+            self.save_project(path)
+        except OSError as e:
+            wx.LogError(f"Could not save {path}: {e}")
+
+    def import_button_pressed(self):
+        path = self.ask_path("Import MIDI", self.MIDI_WILDCARD, save=False)
+        if path is None:
+            return
+        try:
+            self.import_midi(path)
+        except (OSError, ValueError) as e:
+            wx.LogError(f"Could not import {path}: {e}")
+
+    def export_button_pressed(self):
+        path = self.ask_path("Export MIDI", self.MIDI_WILDCARD, save=True)
+        if path is None:
+            return
+        try:
+            self.export_midi(path)
+        except OSError as e:
+            wx.LogError(f"Could not export {path}: {e}")
+
+    def import_midi(self, path: str):
+        bpm, tracks = midi.read(path)
+        synth_entry = next(
+            entry for entry in presets.DEFAULT_VOICE_SET if entry.pitched
+        )
+        for track in tracks:
+            entry = (
+                synth_entry if track.pitched else presets.find_voice_entry(track.name)
+            )
+            if entry is None or not track.notes:
+                continue
+            repeat_length = max(1, math.ceil(track.notes[-1].end))
+            voice = entry.voice
+            # tracks are already sorted and free of overlap
+            voice.notes = audio.NoteIndex.from_sorted(copy.deepcopy(track.notes))
+            voice.repeat_length = repeat_length
+            pitch_window = None
+            if track.pitched:
+                pitches = [note.pitch for note in track.notes]
+                pitch_window = (min(pitches) - 1, max(pitches) + 1)
+            state = VoiceEditorState(
+                quantize=(1, 4),
+                repeat_length=repeat_length,
+                amplitude=round(voice.amplitude * 100),
+                time_window=(0, repeat_length),
+                pitch_window=pitch_window,
+                notes=track.notes,
+            )
+            self.voices_window.add_voice(voice, entry.name, state)
+            self.synced_voices.add_voice(voice)
+
+        self.bpm_field.Value = round(bpm)
+        self.update_bpm()
+
+    def export_midi(self, path: str):
+        tracks = [
+            (midi.Track(name, state.notes, voice.pitched), state.repeat_length)
+            for voice, name, state in self.voices_window.snapshot()
+        ]
+        midi.write(path, tracks, self.bpm_field.Value)
+
+    def save_project(self, path: str):
+        records = []
+        for voice, name, state in self.voices_window.snapshot():
+            records.append(
+                project.VoiceRecord(
+                    preset=name,
+                    notes=state.notes,
+                    repeat_length=state.repeat_length,
+                    amplitude=state.amplitude / 100,
+                    pan=voice.channel.pan,
+                    mute=voice.channel.mute,
+                    solo=voice.channel.solo,
+                    pitched=voice.pitched,
+                    bank=getattr(voice.synth.source, "bank_hash", None),
+                    editor={
+                        "quantize": state.quantize,
+                        "time_window": state.time_window,
+                        "pitch_window": state.pitch_window,
+                    },
+                )
+            )
+        project.save(path, project.Project(self.bpm_field.Value, records))
+
+    def load_project(self, path: str):
+        loaded = project.load(path)
+        for voice in self.voices_window.voices:
+            self.voices_window.remove_voice(voice)
+            self.synced_voices.remove_voice(voice)
+
+        for record in loaded.voices:
+            found = presets.voice_from_record(record)
+            if found is None:
+                print(f"Warning: voice {record.preset} not found, skipping")
+                continue
+            voice, name = found
+            state = VoiceEditorState(
+                quantize=tuple(record.editor.get("quantize", (1, 2))),
+                repeat_length=record.repeat_length,
+                amplitude=round(record.amplitude * 100),
+                time_window=tuple(
+                    record.editor.get("time_window", (0, record.repeat_length))
+                ),
+                pitch_window=(
+                    None
+                    if record.editor.get("pitch_window") is None
+                    else tuple(record.editor["pitch_window"])
+                ),
+                notes=record.notes,
+            )
+            self.voices_window.add_voice(voice, name, state)
+            self.synced_voices.add_voice(voice)
+
+        self.bpm_field.Value = round(loaded.bpm)
+        self.update_bpm()
+
+    def on_playhead_timer(self, event: wx.TimerEvent):
+        index = None
+        if self.synced_voices.enabled:
+            index = self.player.playing_index(self.synced_voices)
+        for editor in self.voices_window.editors:
+            editor.input_strip.set_playhead(
+                None if index is None else editor.voice.beat_at(index)
+            )
+        self.gain_reduction_meter.Value = min(
+            round(self.limiter.gain_reduction), self.METER_RANGE
+        )
+        self.player.retune(idle=not self.synced_voices.enabled)
+
+    def on_reverb_slider(self, event: wx.Event):
+        self.synced_voices.post(
+            setattr,
+            self.reverb,
+            "mix",
+            self.reverb_slider.Value / self.reverb_slider.Max,
+        )
+
+    def on_freeze_checkbox(self, event: wx.Event):
+        self.synced_voices.post(self.update_freeze, self.freeze_checkbox.Value)
+
+    def update_freeze(self, freeze: bool):
+        """Runs on the audio thread"""
+        self.synced_voices.freeze = freeze
+        if not freeze:
+            for voice in self.synced_voices.voices:
+                if not voice.freeze:
+                    voice.frozen = None  # back to live right away
+
     def update_bpm(self):
-        self.synced_voices.bpm = self.bpm_field.Value
+        self.synced_voices.set_bpm(self.bpm_field.Value)
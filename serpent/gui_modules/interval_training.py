@@ -4,7 +4,6 @@ import wx
 import wx.lib.newevent
 import audio
 import instruments
-import notes
 import typing
 
 intervals = [
@@ -236,18 +235,31 @@ DEFAULT_SYNTH = audio.ADSR(
     note_length=1,
 )
 
+# every root and degree the exercise can play
+CACHED_PITCHES = range(MIDDLE_C, MIDDLE_C + 25)
+NOTE_CACHE = audio.NoteCache()
+NOTE_CACHE.fill(DEFAULT_SYNTH, CACHED_PITCHES)
+
 
 class AudioHandler:
     """@root: int, midi index of root note"""
 
     def __init__(self, root: int):
+        # never played live, only rendered, so the audio thread only
+        # ever copies buffers
         self.synth = copy.deepcopy(DEFAULT_SYNTH)
-        self.player = audio.Player([self.synth])
+        self.note_player = audio.BufferPlayer()
+        self.player = audio.Player([self.note_player], profile="interactive")
         self.root = root
 
     def play_note(self, degree: int):
-        self.synth.source.frequency = notes.freq_from_midi_index(self.root + degree)
-        self.synth.rewind()
+        self.player.retune(idle=True)  # between notes
+        pitch = self.root + degree
+        buffer = NOTE_CACHE.get(self.synth, pitch)
+        if buffer is None:
+            # still rendering, or out of the cached range
+            buffer = NOTE_CACHE.render(self.synth, pitch)
+        self.note_player.play(buffer)
 
 
 class IntervalTraining(wx.Panel):
@@ -1,10 +1,14 @@
+import copy
+import functools
+import hashlib
 import math
+import os
 import random
 
 import numpy as np
-import librosa
 
 import audio
+import kernels
 import settings
 
 
@@ -12,6 +16,126 @@ def lerp(a: float, b: float, t: float) -> float:
     return t * (b - a) + a
 
 
+def deepcopy_sharing(obj, memo: dict, shared: list):
+    """deepcopy obj, but reuse the objects in shared instead of
+    copying them. For large read-only data like decoded samples."""
+    for item in shared:
+        memo[id(item)] = item
+    new = copy.copy(obj)
+    memo[id(obj)] = new
+    new.__dict__ = copy.deepcopy(obj.__dict__, memo)
+    return new
+
+
+def file_hash(file) -> str:
+    with open(file, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class Sample:
+    """Decoded sample, stored as float32 or, if compact, as int16
+    with a scale factor, using half the memory. Converted to float
+    only for what is played."""
+
+    def __init__(self, frames: np.ndarray, compact: bool = False):
+        if compact:
+            peak = float(np.max(np.abs(frames))) if len(frames) else 0
+            self.scale = peak / 32767 if peak > 0 else 1.0
+            self.data = np.round(frames / self.scale).astype(np.int16)
+        else:
+            self.scale = 1.0
+            self.data = frames  # may be memory mapped, so not copied
+        self.compact = compact
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: int) -> float:
+        return self.data[index] * self.scale
+
+    def block(self, start: int, frames: int) -> np.ndarray:
+        """float32 samples start to start + frames, silent outside the sample"""
+        out = np.zeros(frames, dtype=np.float32)
+        begin, end = max(start, 0), min(start + frames, len(self.data))
+        if begin < end:
+            np.multiply(
+                self.data[begin:end], self.scale, out=out[begin - start : end - start]
+            )
+        return out
+
+    def at(self, indices: np.ndarray, out: np.ndarray, source: audio.Sampleable):
+        """Samples at indices rounded to the nearest, silent outside
+        the sample, into out. Works in arrays of source, the one
+        playing it, as Samples are shared."""
+        if len(self.data) == 0:
+            out.fill(0)
+            return
+        frames = len(indices)
+        rounded = np.rint(indices, out=out)
+        outside = np.less(rounded, 0, out=source.work_array("outside", frames, bool))
+        past = np.greater_equal(
+            rounded, len(self.data), out=source.work_array("past", frames, bool)
+        )
+        outside |= past
+        positions = source.work_array("positions", frames, np.intp)
+        np.copyto(positions, rounded, casting="unsafe")
+        taken = source.work_array("taken", frames, self.data.dtype)
+        np.take(self.data, positions, out=taken, mode="clip")
+        # scaled in the precision of self.data * self.scale, like __getitem__
+        if self.compact:
+            np.copyto(out, taken)
+            out *= self.scale
+        else:
+            taken *= self.scale
+            np.copyto(out, taken)
+        np.putmask(out, outside, 0)
+
+
+@functools.cache
+def load_sample(
+    file, samplerate: int, compact: bool = settings.compact_samples
+) -> Sample:
+    """Decoded, resampled and trimmed once per rate, then shared.
+    With settings.sample_cache_dir set, decoded samples are kept
+    there and memory mapped, so processes share them too. Those
+    are left as float32, as their memory is shared already."""
+    cache_dir = settings.sample_cache_dir
+    if cache_dir is not None:
+        path = os.path.join(cache_dir, f"{file_hash(file)}_{samplerate}.npy")
+        if not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            partial = f"{path}.{os.getpid()}.npy"
+            np.save(partial, decode_sample(file, samplerate))
+            os.replace(partial, path)  # other processes never see half a file
+        return Sample(np.load(path, mmap_mode="r"))
+
+    frames = decode_sample(file, samplerate)
+    frames.flags.writeable = False
+    return Sample(frames, compact)
+
+
+def decode_sample(file, samplerate: int) -> np.ndarray:
+    import librosa  # slow to import, and only needed for samples
+
+    frames, _ = librosa.core.load(file, sr=samplerate)
+    return trim_silence(frames.astype(np.float32, copy=False))
+
+
+def trim_silence(
+    frames: np.ndarray, threshold: float = settings.sample_trim_threshold
+) -> np.ndarray:
+    """Cut off the tail below threshold"""
+    loud = np.flatnonzero(np.abs(frames) > threshold)
+    return frames[: loud[-1] + 1 if len(loud) else 0]
+
+
+def bank_hash(files: list) -> str:
+    """Content hash of a set of sample files, independent of
+    their names and order"""
+    digests = [file_hash(file) for file in files]
+    return hashlib.sha1("".join(sorted(digests)).encode()).hexdigest()
+
+
 class Noise(audio.Sampleable):
 
     def __init__(self, pitch=12000, amplitude: float = 1, *args, **kw):
@@ -19,14 +143,8 @@ class Noise(audio.Sampleable):
         self.pitch = pitch
         self.amplitude = amplitude
 
-    @staticmethod
-    def garble(x):
-        return (x + 20) ** 3.5 % 25 / 25
-
-    @staticmethod
-    def rough_random(x):
-        # run i though garble() a few times to randomize
-        return Noise.garble(1 + Noise.garble(1 + Noise.garble(x)))
+    garble = staticmethod(kernels.garble)
+    rough_random = staticmethod(kernels.rough_random)
 
     def get_sample_at_index(self, index):
         # linearly interpolate between noise points
@@ -39,6 +157,12 @@ class Noise(audio.Sampleable):
             * self.amplitude
         )
 
+    def render_at(self, indices, out):
+        x = np.divide(indices, self.samplerate, out=self.work_array("x", len(out)))
+        x *= self.pitch
+        kernels.noise(x, out, self.work_array)
+        out *= self.amplitude
+
 
 class Sine(audio.Sampleable):
 
@@ -55,6 +179,12 @@ class Sine(audio.Sampleable):
             * self.amplitude
         )
 
+    def render_at(self, indices, out):
+        np.multiply(indices, math.tau * self.frequency, out=out)
+        out /= self.samplerate
+        np.sin(out, out=out)
+        out *= self.amplitude
+
 
 class Square(audio.Sampleable):
 
@@ -70,6 +200,15 @@ class Square(audio.Sampleable):
             1 if (self.frequency * index / self.samplerate) % 2 > 1 else 0
         ) * self.amplitude
 
+    def render_at(self, indices, out):
+        np.multiply(indices, self.frequency, out=out)
+        out /= self.samplerate
+        np.remainder(out, 2, out=out)
+        # 1 over the second half of each period, 0 elsewhere
+        out -= 1
+        np.heaviside(out, 0, out=out)
+        out *= self.amplitude
+
 
 class Saw(audio.Sampleable):
 
@@ -83,6 +222,12 @@ class Saw(audio.Sampleable):
     def get_sample_at_index(self, index):
         return ((self.frequency * index / self.samplerate) % 1) * self.amplitude
 
+    def render_at(self, indices, out):
+        np.multiply(indices, self.frequency, out=out)
+        out /= self.samplerate
+        np.remainder(out, 1, out=out)
+        out *= self.amplitude
+
 
 class Harmonics(audio.Sampleable):
 
@@ -93,7 +238,7 @@ class Harmonics(audio.Sampleable):
         amplitude=1,
         normalize=True,
         *args,
-        **kw
+        **kw,
     ):
         super().__init__(*args, **kw)
         self._harmonics = harmonics
@@ -104,6 +249,10 @@ class Harmonics(audio.Sampleable):
             harmonics, settings.harmonics_lut_resolution, self.normalize
         )
 
+    def __deepcopy__(self, memo):
+        # the table is replaced, never modified, so copies can share it
+        return deepcopy_sharing(self, memo, [self.lut])
+
     @property
     def harmonics(self):
         return self._harmonics
@@ -116,23 +265,20 @@ class Harmonics(audio.Sampleable):
         )
 
     @staticmethod
-    def generate_lut(harmnonics, resolution, normalize):
-        times = np.arange(0, 1, 1 / resolution)
-        samples = []
-        for time in times:
-            total = 0
-            harmonic = 1
-            for harmonic_amp in harmnonics:
-                total += math.sin(math.tau * time * harmonic) * harmonic_amp
-                harmonic += 1
-            samples.append(total)
+    def generate_lut(harmnonics, resolution, normalize) -> np.ndarray:
+        times = np.arange(resolution) / resolution
+        samples = np.zeros(resolution)
+        for harmonic, harmonic_amp in enumerate(harmnonics, start=1):
+            samples += np.sin(math.tau * harmonic * times) * harmonic_amp
 
         if normalize:
-            max_level = max(samples)
-            samples = [sample / max_level for sample in samples]
+            samples /= samples.max()
 
         return samples
 
+    def parameters(self) -> tuple:
+        return ("Harmonics", tuple(self._harmonics), self.amplitude, self.normalize)
+
     def lut_lookup(self, time):
         """'Sine' function that looks up the table"""
         lut_index = math.floor(len(self.lut) * (time % 1))
@@ -143,11 +289,30 @@ class Harmonics(audio.Sampleable):
             self.frequency * index / self.samplerate
         )
 
+    def render_block(self, start, frames):
+        out = np.zeros(frames)
+        self.render_at(np.arange(start, start + frames), out)
+        return out
+
+    def render_at(self, indices, out):
+        times = np.multiply(indices, self.frequency, out=out)
+        times /= self.samplerate
+        np.remainder(times, 1, out=times)
+        times *= len(self.lut)
+        lut_indices = self.work_array("lut_indices", len(out), np.intp)
+        np.copyto(lut_indices, times, casting="unsafe")
+        np.take(self.lut, lut_indices, out=out, mode="clip")
+        out *= self.amplitude
+
 
 class AudioFile(audio.Sampleable):
     def __init__(self, file, amplitude: float = 1, *args, **kw):
         super().__init__(*args, **kw)
-        self.frames, _ = librosa.core.load(file, sr=self.samplerate)
+        self.frames = load_sample(file, self.samplerate)
+        self.bank_hash = bank_hash([file])
+
+    def __deepcopy__(self, memo):
+        return deepcopy_sharing(self, memo, [self.frames])
 
     def get_sample_at_index(self, index):
         rounded = round(index)
@@ -155,6 +320,12 @@ class AudioFile(audio.Sampleable):
             return 0
         return self.frames[rounded]
 
+    def render_block(self, start, frames):
+        return self.frames.block(start, frames)
+
+    def render_at(self, indices, out):
+        self.frames.at(indices, out, self)
+
 
 class RoundRobin(audio.Sampleable):
     """Round-robin version of AudioFile that chooses a new file to play with each rewind()"""
@@ -163,8 +334,14 @@ class RoundRobin(audio.Sampleable):
         super().__init__(*args, **kw)
         self.sounds = []
         for file in files:
-            self.sounds.append(librosa.core.load(file, sr=self.samplerate)[0])
+            self.sounds.append(load_sample(file, self.samplerate))
         self.selected_sound = random.choice(self.sounds)
+        self.bank_hash = bank_hash(files)
+        self.varies = True
+
+    def __deepcopy__(self, memo):
+        # copies play the same decoded samples
+        return deepcopy_sharing(self, memo, [self.sounds, *self.sounds])
 
     def get_sample_at_index(self, index):
         rounded = round(index)
@@ -172,6 +349,12 @@ class RoundRobin(audio.Sampleable):
             return 0
         return self.selected_sound[rounded]
 
+    def render_block(self, start, frames):
+        return self.selected_sound.block(start, frames)
+
+    def render_at(self, indices, out):
+        self.selected_sound.at(indices, out, self)
+
     def rewind(self):
         self.sample_index = 0
         self.selected_sound = random.choice(self.sounds)
@@ -190,6 +373,14 @@ class BassDrum(audio.Sampleable):
         envelope = math.pow(((index / self.samplerate) * 0.6) + 1, -20)
         return envelope * self.amplitude * self.harmonics.get_sample_at_index(index)
 
+    def render_at(self, indices, out):
+        envelope = self.work_array("envelope", len(out))
+        np.divide(indices, self.samplerate, out=envelope)
+        kernels.bass_drum_envelope(envelope, envelope, self.work_array)
+        envelope *= self.amplitude
+        self.harmonics.render_at(indices, out)
+        out *= envelope
+
 
 class HiHatDrum(audio.Sampleable):
     def __init__(self, amplitude: float = 1, *args, **kw):
@@ -201,6 +392,14 @@ class HiHatDrum(audio.Sampleable):
         envelope = 0.5 * math.pow((index / self.samplerate) + 1, -40)
         return envelope * self.amplitude * self.noise.get_sample_at_index(index)
 
+    def render_at(self, indices, out):
+        envelope = self.work_array("envelope", len(out))
+        np.divide(indices, self.samplerate, out=envelope)
+        kernels.hi_hat_envelope(envelope, envelope, self.work_array)
+        envelope *= self.amplitude
+        self.noise.render_at(indices, out)
+        out *= envelope
+
 
 class SnareDrum(audio.Sampleable):
     def __init__(self, amplitude: float = 1, *args, **kw):
@@ -220,3 +419,13 @@ class SnareDrum(audio.Sampleable):
             self.harmonics.get_sample_at_index(index)
             + self.noise.get_sample_at_index(index)
         )
+
+    def render_at(self, indices, out):
+        envelope = self.work_array("envelope", len(out))
+        np.divide(indices, self.samplerate, out=envelope)
+        kernels.snare_drum_envelope(envelope, envelope, self.work_array)
+        noise = self.work_array("noise", len(out))
+        self.noise.render_at(indices, noise)
+        self.harmonics.render_at(indices, out)
+        out += noise
+        out *= envelope
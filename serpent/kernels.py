@@ -0,0 +1,230 @@
+"""Per-sample functions of instruments, run over whole blocks.
+
+Some sounds, like Noise's garbling, are easiest written one sample
+at a time. Written with NumPy's functions, the same code runs on
+arrays too, but makes a temporary array for every step. With Numba
+installed, kernels are instead compiled into ufuncs that run the
+code once per sample, at the speed of C. Without it, or with
+settings.jit_kernels off, NumPy runs them.
+
+NumPy runs each kernel through a version written for it, working in
+place in out and in arrays from work, like Sampleable.work_array, so
+that rendering doesn't allocate either way.
+
+Compiled kernels give exactly what the function gives for one
+sample in Python, as long as powers are of floats, which both
+leave to pow(). NumPy rounds powers its own way, so the envelopes
+differ in the last digit. Noise's garbling would turn that into
+different noise altogether, so for noise NumPy leaves the points
+it interpolates between to the same Python code, one call for
+each, and matches the other backends.
+
+    python kernels.py --benchmark
+
+times both backends on a block of samples."""
+
+import argparse
+import math
+import time
+
+import numpy as np
+
+import settings
+
+try:
+    import numba
+    from numba.extending import register_jitable
+except ImportError:
+    numba = None
+
+    def register_jitable(function):
+        return function
+
+
+BACKENDS = ("numba", "numpy")
+backend = "numba" if numba is not None and settings.jit_kernels else "numpy"
+
+
+def allocate(name: str, frames: int, dtype=np.float64) -> np.ndarray:
+    """work for kernels run outside of rendering"""
+    return np.zeros(frames, dtype)
+
+
+class Kernel:
+    """A function of one sample, run over arrays by backend"""
+
+    def __init__(self, function):
+        self.function = function
+        self.__name__ = function.__name__
+        self._compiled = None
+        self.in_place = None  # for NumPy, see .numpy()
+        if backend == "numba":
+            # compiled up front, not when first played
+            self.compile()
+
+    def compile(self):
+        """The Numba ufunc of .function, compiled on first use and
+        cached on disk, for other backends only when asked for"""
+        if self._compiled is None:
+            self._compiled = numba.vectorize(["float64(float64)"], cache=True)(
+                self.function
+            )
+        return self._compiled
+
+    def numpy(self, in_place):
+        """Decorator for what NumPy runs instead of .function, like
+        property.setter: in_place(values, out, work) writes the same
+        into out without allocating, which may be values"""
+        self.in_place = in_place
+        return self
+
+    def __call__(
+        self, values: np.ndarray, out: np.ndarray, work=allocate, using: str = None
+    ):
+        """function of each of values, into out, using backend by default"""
+        if (using or backend) == "numba":
+            self.compile()(values, out=out)
+        elif self.in_place is not None:
+            self.in_place(values, out, work)
+        else:
+            out[:] = self.function(values)
+
+
+@register_jitable
+def lerp(a, b, t):
+    return t * (b - a) + a
+
+
+@register_jitable
+def garble(x):
+    return (x + 20) ** 3.5 % 25 / 25
+
+
+@register_jitable
+def rough_random(x):
+    # run i though garble() a few times to randomize
+    return garble(1 + garble(1 + garble(x)))
+
+
+@Kernel
+def noise(x):
+    """Noise at x = seconds * pitch, between 0 and 1. Linearly
+    interpolated between noise points, to avoid bad-sounding
+    bitcrushing."""
+    return lerp(rough_random(np.floor(x)), rough_random(np.ceil(x)), x % 1)
+
+
+@noise.numpy
+def noise(x, out, work):
+    if len(x) == 0:
+        return
+    # every noise point from below to above x, in the same order. x
+    # comes from ascending indices, so its ends bound it, and min()
+    # and max() would allocate
+    low, high = sorted((float(x[0]), float(x[-1])))
+    first = math.floor(low)
+    # sized for any x as wide, so the array doesn't grow by a point
+    points = work("points", math.ceil(high - low) + 3)
+    points = points[: math.ceil(high) - first + 1]
+    for i in range(len(points)):
+        points[i] = rough_random(first + i)
+
+    low = np.floor(x, out=work("low", len(x)))
+    high = np.ceil(x, out=work("high", len(x)))
+    np.remainder(x, 1, out=out)
+    positions = work("positions", len(x), np.intp)
+    for bound in (low, high):
+        bound -= first
+        np.copyto(positions, bound, casting="unsafe")
+        np.take(points, positions, out=bound, mode="clip")
+    # lerp()
+    high -= low
+    out *= high
+    out += low
+
+
+@Kernel
+def bass_drum_envelope(seconds):
+    return (seconds * 0.6 + 1) ** -20.0
+
+
+@bass_drum_envelope.numpy
+def bass_drum_envelope(seconds, out, work):
+    np.multiply(seconds, 0.6, out=out)
+    out += 1
+    out **= -20.0
+
+
+@Kernel
+def hi_hat_envelope(seconds):
+    return 0.5 * (seconds + 1) ** -40.0
+
+
+@hi_hat_envelope.numpy
+def hi_hat_envelope(seconds, out, work):
+    np.add(seconds, 1, out=out)
+    out **= -40.0
+    out *= 0.5
+
+
+@Kernel
+def snare_drum_envelope(seconds):
+    return np.minimum(np.maximum(1.25 * (seconds * 0.8 + 1) ** -40.0, 0), 1)
+
+
+@snare_drum_envelope.numpy
+def snare_drum_envelope(seconds, out, work):
+    np.multiply(seconds, 0.8, out=out)
+    out += 1
+    out **= -40.0
+    out *= 1.25
+    np.maximum(out, 0, out=out)
+    np.minimum(out, 1, out=out)
+
+
+KERNELS = [noise, bass_drum_envelope, hi_hat_envelope, snare_drum_envelope]
+
+
+def benchmark(frames=settings.chunksize, repeats=20):
+    """Print how long each kernel takes for a block of frames, one
+    sample at a time in Python and on each backend, and how far the
+    backends are from Python"""
+    if numba is None:
+        print("Numba is not installed, timing NumPy only")
+    available = [name for name in BACKENDS if name != "numba" or numba is not None]
+    seconds = np.arange(frames) / settings.samplerate
+    for kernel in KERNELS:
+        values = seconds * 12000 if kernel is noise else seconds  # Noise's pitch
+        begin = time.perf_counter()
+        expected = np.fromiter(map(kernel.function, values.tolist()), np.float64)
+        elapsed = time.perf_counter() - begin
+        print(f"{kernel.__name__:20} python {elapsed * 1e6:8.1f} µs per block")
+        out = np.zeros(frames)
+        for name in available:
+            kernel(values, out, using=name)  # warm up caches
+            begin = time.perf_counter()
+            for _ in range(repeats):
+                kernel(values, out, using=name)
+            elapsed = (time.perf_counter() - begin) / repeats
+            difference = np.max(np.abs(out - expected))
+            print(
+                f"{kernel.__name__:20} {name:6} {elapsed * 1e6:8.1f} µs per block, "
+                f"{difference:.3g} from python"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-sample instrument kernels")
+    parser.add_argument(
+        "--benchmark", action="store_true", help="time the Numba and NumPy backends"
+    )
+    parser.add_argument("--frames", type=int, default=settings.chunksize)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.frames)
+    else:
+        print(f"Running kernels with {backend}")
+
+
+if __name__ == "__main__":
+    main()
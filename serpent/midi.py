@@ -0,0 +1,323 @@
+import math
+import struct
+
+import numpy as np
+
+import audio
+
+TICKS_PER_BEAT = 480
+DEFAULT_BPM = 120
+PERCUSSION_CHANNEL = 9  # zero-indexed channel 10
+NOTE_VELOCITY = 100
+
+# General MIDI percussion notes for each entry of the default voice set
+DRUM_NOTES = {
+    "Drumstick": [37, 31],
+    "Snare drum": [38, 40],
+    "Hi-hat": [42, 44, 46],
+    "Toms": [45, 41, 43, 47, 48, 50],
+    "Crash cymbals": [49, 52, 55, 57],
+    "Ride cymbal A": [51, 59],
+    "Ride cymbal B": [53],
+}
+DRUM_VOICES = {note: name for name, drums in DRUM_NOTES.items() for note in drums}
+
+
+class Track:
+    """Notes bound for one voice. For percussion .name is the
+    voice set entry, otherwise it is the MIDI track name."""
+
+    def __init__(self, name: str, notes: list[audio.Note], pitched: bool):
+        self.name = name
+        self.notes = notes
+        self.pitched = pitched
+
+
+def _read_varlen(data: bytes, offset: int) -> tuple[int, int]:
+    value = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset
+
+
+def _write_varlen(value: int) -> bytes:
+    result = [value & 0x7F]
+    value >>= 7
+    while value:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(result))
+
+
+def _parse_track(data: bytes):
+    """Returns (name, tempo in microseconds per beat or None,
+    note event columns: ticks, is_on, channel, pitch)"""
+    name, tempo = "", None
+    ticks, is_on, channels, pitches = [], [], [], []
+    tick, offset, status = 0, 0, 0
+    while offset < len(data):
+        delta, offset = _read_varlen(data, offset)
+        tick += delta
+        if data[offset] & 0x80:
+            status = data[offset]
+            offset += 1
+        # else running status, reuse the last one
+
+        if status == 0xFF:  # meta event
+            kind = data[offset]
+            length, offset = _read_varlen(data, offset + 1)
+            if kind == 0x03 and not name:
+                name = data[offset : offset + length].decode("latin-1")
+            elif kind == 0x51 and tempo is None:
+                tempo = int.from_bytes(data[offset : offset + 3], "big")
+            offset += length
+        elif status in (0xF0, 0xF7):  # sysex
+            length, offset = _read_varlen(data, offset)
+            offset += length
+        else:
+            kind = status & 0xF0
+            if kind in (0xC0, 0xD0):
+                offset += 1
+                continue
+            pitch, velocity = data[offset], data[offset + 1]
+            offset += 2
+            if kind == 0x90 or kind == 0x80:
+                ticks.append(tick)
+                is_on.append(kind == 0x90 and velocity > 0)
+                channels.append(status & 0x0F)
+                pitches.append(pitch)
+    return name, tempo, ticks, is_on, channels, pitches
+
+
+def _pair_notes(ticks, is_on, channels, pitches):
+    """Match every note on with the next note off of the same
+    channel and pitch, in the order the events were written.
+    Notes that end where they start last one tick. Returns start
+    ticks, end ticks, channels and pitches of the notes."""
+    ticks = np.asarray(ticks, dtype=np.int64)
+    is_on = np.asarray(is_on, dtype=bool)
+    keys = np.asarray(channels, dtype=np.int64) * 128 + np.asarray(pitches)
+    # group by key, in file order, which is also time order
+    order = np.argsort(keys, kind="stable")
+    ticks, is_on, keys = ticks[order], is_on[order], keys[order]
+
+    ons = np.flatnonzero(is_on)
+    offs = np.flatnonzero(~is_on)
+    following = np.searchsorted(offs, ons)
+    paired = following < len(offs)
+    ons, following = ons[paired], following[paired]
+    ends = offs[following]
+    matched = keys[ends] == keys[ons]
+    ons, ends = ons[matched], ends[matched]
+    starts = ticks[ons]
+    # drum hits are often written as an on and off at the same tick
+    ends = np.maximum(ticks[ends], starts + 1)
+    return starts, ends, keys[ons] // 128, keys[ons] % 128
+
+
+def _monophonic(starts: np.ndarray, ends: np.ndarray):
+    """Sort, and shorten notes to end where the next one starts.
+    Notes starting together keep only the first."""
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    keep = np.ones(len(starts), dtype=bool)
+    keep[1:] = starts[1:] != starts[:-1]
+    starts, ends, order = starts[keep], ends[keep], order[keep]
+    ends = np.minimum(ends, np.append(starts[1:], np.inf))
+    return starts, ends, order
+
+
+def _lanes(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Lane for each (sorted) note so that notes in a lane don't overlap"""
+    lanes = np.zeros(len(starts), dtype=np.int64)
+    if len(starts) < 2 or np.all(starts[1:] >= ends[:-1]):
+        return lanes  # already monophonic, the common case
+    lane_ends: list[float] = []
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        for lane, lane_end in enumerate(lane_ends):
+            if lane_end <= start:
+                break
+        else:
+            lane = len(lane_ends)
+            lane_ends.append(0)
+        lane_ends[lane] = end
+        lanes[i] = lane
+    return lanes
+
+
+def read(path: str) -> tuple[float, list[Track]]:
+    """Returns the file's tempo in BPM and its notes grouped into
+    monophonic tracks. Polyphonic tracks are split into several,
+    percussion is split by drum voice."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != b"MThd":
+        raise ValueError(f"{path} is not a MIDI file")
+    try:
+        header_length = struct.unpack(">I", data[4:8])[0]
+        _, _, division = struct.unpack(">HHH", data[8:14])
+    except struct.error:
+        raise ValueError(f"{path} has a truncated header") from None
+    if division == 0:
+        raise ValueError(f"{path} has no ticks per beat")
+    if division & 0x8000:
+        raise ValueError("SMPTE timed MIDI files are not supported")
+
+    bpm = None
+    tracks = []
+    offset = 8 + header_length
+    while offset + 8 <= len(data):
+        kind = data[offset : offset + 4]
+        length = struct.unpack(">I", data[offset + 4 : offset + 8])[0]
+        chunk = data[offset + 8 : offset + 8 + length]
+        offset += 8 + length
+        if kind != b"MTrk":
+            continue  # unknown chunks are to be skipped
+
+        try:
+            name, tempo, *events = _parse_track(chunk)
+        except IndexError:
+            raise ValueError(f"{path} has a truncated track") from None
+        if bpm is None and tempo:
+            bpm = 60_000_000 / tempo
+        if not events[0]:
+            continue
+        starts, ends, channels, pitches = _pair_notes(*events)
+        starts, ends = starts / division, ends / division
+        percussion = channels == PERCUSSION_CHANNEL
+        tracks += _drum_tracks(
+            starts[percussion], ends[percussion], pitches[percussion]
+        )
+        tracks += _pitched_tracks(
+            name or f"Track {len(tracks) + 1}",
+            starts[~percussion],
+            ends[~percussion],
+            pitches[~percussion],
+        )
+    return (DEFAULT_BPM if bpm is None else bpm), tracks
+
+
+def _pitched_tracks(name, starts, ends, pitches) -> list[Track]:
+    order = np.lexsort((-pitches, starts))  # highest note first in chords
+    starts, ends, pitches = starts[order], ends[order], pitches[order]
+    lanes = _lanes(starts, ends)
+    tracks = []
+    for lane in range(lanes.max() + 1 if len(lanes) else 0):
+        in_lane = lanes == lane
+        lane_starts, lane_ends, order = _monophonic(starts[in_lane], ends[in_lane])
+        lane_pitches = pitches[in_lane][order]
+        valid = lane_ends > lane_starts
+        tracks.append(
+            Track(
+                name if lane == 0 else f"{name} ({lane + 1})",
+                [
+                    audio.PitchedNote(start, end - start, pitch)
+                    for start, end, pitch in zip(
+                        lane_starts[valid].tolist(),
+                        lane_ends[valid].tolist(),
+                        lane_pitches[valid].tolist(),
+                    )
+                ],
+                pitched=True,
+            )
+        )
+    return tracks
+
+
+def _drum_tracks(starts, ends, pitches) -> list[Track]:
+    voices = np.array([DRUM_VOICES.get(pitch, "") for pitch in pitches.tolist()])
+    unmapped = np.count_nonzero(voices == "")
+    if unmapped:
+        print(f"Warning: {unmapped} percussion notes have no matching voice")
+    tracks = []
+    for name in DRUM_NOTES:
+        in_voice = voices == name
+        if not np.any(in_voice):
+            continue
+        drum_starts, drum_ends, _ = _monophonic(starts[in_voice], ends[in_voice])
+        valid = drum_ends > drum_starts
+        tracks.append(
+            Track(
+                name,
+                [
+                    audio.Note(start, end - start)
+                    for start, end in zip(
+                        drum_starts[valid].tolist(), drum_ends[valid].tolist()
+                    )
+                ],
+                pitched=False,
+            )
+        )
+    return tracks
+
+
+def _track_chunk(events: bytes) -> bytes:
+    events += b"\x00\xff\x2f\x00"  # end of track
+    return b"MTrk" + struct.pack(">I", len(events)) + events
+
+
+def _note_events(track: Track, repeat_length: int, length: int) -> bytes:
+    if track.pitched:
+        channel = 0
+        pitches = np.array([note.pitch for note in track.notes], dtype=np.int64)
+    else:
+        channel = PERCUSSION_CHANNEL
+        drum = DRUM_NOTES.get(track.name, DRUM_NOTES["Drumstick"])[0]
+        pitches = np.full(len(track.notes), drum, dtype=np.int64)
+    times = np.array([note.time for note in track.notes])
+    lengths = np.array([note.length for note in track.notes])
+
+    # repeat the pattern to fill the exported length
+    repeats = max(length // repeat_length, 1)
+    offsets = np.repeat(np.arange(repeats) * repeat_length, len(times))
+    times = np.tile(times, repeats) + offsets
+    lengths, pitches = np.tile(lengths, repeats), np.tile(pitches, repeats)
+
+    starts = np.round(times * TICKS_PER_BEAT).astype(np.int64)
+    ends = np.maximum(np.round((times + lengths) * TICKS_PER_BEAT), starts + 1)
+    ticks = np.concatenate((starts, ends.astype(np.int64)))
+    is_on = np.concatenate((np.ones(len(starts), bool), np.zeros(len(ends), bool)))
+    pitches = np.concatenate((pitches, pitches))
+    order = np.lexsort((is_on, ticks))  # offs before ons at the same tick
+    deltas = np.diff(ticks[order], prepend=0)
+
+    events = bytearray()
+    for delta, on, pitch in zip(
+        deltas.tolist(), is_on[order].tolist(), pitches[order].tolist()
+    ):
+        events += _write_varlen(delta)
+        events += bytes(
+            (
+                0x90 | channel if on else 0x80 | channel,
+                pitch,
+                NOTE_VELOCITY if on else 0,
+            )
+        )
+    return bytes(events)
+
+
+def write(path: str, tracks: list[tuple[Track, int]], bpm: float):
+    """tracks are (track, repeat length in beats). Patterns are
+    repeated until all of them line up again."""
+    length = math.lcm(*[repeat_length for _, repeat_length in tracks]) if tracks else 1
+
+    tempo = round(60_000_000 / bpm).to_bytes(3, "big")
+    chunks = [_track_chunk(b"\x00\xff\x51\x03" + tempo)]
+    for track, repeat_length in tracks:
+        name = track.name.encode("latin-1", errors="replace")
+        chunks.append(
+            _track_chunk(
+                b"\x00\xff\x03"
+                + _write_varlen(len(name))
+                + name
+                + _note_events(track, repeat_length, length)
+            )
+        )
+
+    with open(path, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(chunks), TICKS_PER_BEAT))
+        for chunk in chunks:
+            f.write(chunk)
@@ -0,0 +1,162 @@
+"""Voices to choose from, shared by the backing track and headless
+rendering. Samples are found next to this file, so it works from
+any working directory."""
+
+import copy
+import os
+
+import audio
+import instruments
+import project
+
+SAMPLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "samples")
+
+
+class VoiceEntry:
+    """.voice should not be changed once initialized"""
+
+    def __init__(self, voice: audio.Voice, name: str):
+        self._voice = voice
+        self._name = name
+
+    @property
+    def voice(self) -> audio.Voice:
+        return copy.deepcopy(self._voice)
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def pitched(self) -> bool:
+        return self._voice.pitched
+
+    @property
+    def bank(self) -> str | None:
+        """Content hash of the samples played, None if synthesized"""
+        return getattr(self._voice.synth.source, "bank_hash", None)
+
+
+def find_voice_entry(name: str, bank: str | None = None) -> VoiceEntry | None:
+    """Prefer the entry playing the same samples, which may have been renamed"""
+    if bank is not None:
+        for entry in DEFAULT_VOICE_SET:
+            if entry.bank == bank:
+                return entry
+    for entry in DEFAULT_VOICE_SET:
+        if entry.name == name:
+            return entry
+    return None
+
+
+# helper method
+def list_files(path):
+    path = os.path.join(SAMPLES_PATH, path)
+    return [os.path.join(path, file) for file in os.listdir(path)]
+
+
+DEFAULT_VOICE_SET = [
+    VoiceEntry(
+        audio.Voice(audio.ADSR(instruments.Harmonics()), [], 4, 4, True),
+        "Synthesizer 1",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("ride_a")),
+                release_len=2,
+            ),
+            [],
+            4,
+            4,
+            pan=0.5,
+        ),
+        "Ride cymbal A",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("ride_b")),
+                release_len=2,
+            ),
+            [],
+            4,
+            4,
+            pan=0.6,
+        ),
+        "Ride cymbal B",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("hihat")),
+            ),
+            [],
+            4,
+            4,
+            pan=-0.4,
+        ),
+        "Hi-hat",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("snare")),
+            ),
+            [],
+            4,
+            4,
+            pan=-0.1,
+        ),
+        "Snare drum",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("tom")),
+            ),
+            [],
+            4,
+            4,
+            pan=0.3,
+        ),
+        "Toms",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(instruments.RoundRobin(list_files("crash")), release_len=2.5),
+            [],
+            4,
+            4,
+            pan=-0.5,
+        ),
+        "Crash cymbals",
+    ),
+    VoiceEntry(
+        audio.Voice(
+            audio.ADSR(
+                instruments.RoundRobin(list_files("drumstick")),
+            ),
+            [],
+            4,
+            4,
+        ),
+        "Drumstick",
+    ),
+]
+
+
+def voice_from_record(record: project.VoiceRecord) -> tuple[audio.Voice, str] | None:
+    """(voice, preset name) for a voice saved in a project,
+    None if its preset isn't available"""
+    entry = find_voice_entry(record.preset, record.bank)
+    if entry is None:
+        return None
+    voice = entry.voice  # copies share the decoded samples
+    voice.notes = copy.deepcopy(record.notes)
+    voice.repeat_length = record.repeat_length
+    voice.amplitude = record.amplitude
+    voice.channel.pan = record.pan
+    voice.channel.mute = record.mute
+    voice.channel.solo = record.solo
+    return voice, entry.name
@@ -0,0 +1,158 @@
+"""Saving and loading backing track sessions.
+
+A project file is a JSON header followed by the notes of every
+voice, stored column by column:
+
+    MAGIC | uint32 header length | JSON header | times | lengths | pitches
+
+times and lengths are little-endian float64, pitches are int16
+(0 for unpitched notes). Each voice owns a contiguous slice of the
+columns. Voices refer to their preset by name and to its sample
+bank by content hash, so samples are never stored in the project."""
+
+import json
+import struct
+
+import numpy as np
+
+import audio
+
+MAGIC = b"SERPENT\0"
+VERSION = 1
+HEADER_LENGTH = struct.Struct("<I")
+
+
+class VoiceRecord:
+    """.editor holds how the voice was shown (quantize, windows),
+    it is not needed to play the voice"""
+
+    def __init__(
+        self,
+        preset: str,
+        notes: list[audio.Note],
+        repeat_length: int,
+        amplitude: float,
+        pan: float = 0,
+        mute: bool = False,
+        solo: bool = False,
+        pitched: bool = False,
+        bank: str | None = None,
+        editor: dict | None = None,
+    ):
+        self.preset = preset
+        self.notes = notes
+        self.repeat_length = repeat_length
+        self.amplitude = amplitude
+        self.pan = pan
+        self.mute = mute
+        self.solo = solo
+        self.pitched = pitched
+        self.bank = bank
+        self.editor = {} if editor is None else editor
+
+
+class Project:
+    def __init__(self, bpm: float, voices: list[VoiceRecord]):
+        self.bpm = bpm
+        self.voices = voices
+
+
+def save(path: str, project: Project):
+    notes = [note for voice in project.voices for note in voice.notes]
+    times = np.array([note.time for note in notes], dtype="<f8")
+    lengths = np.array([note.length for note in notes], dtype="<f8")
+    pitches = np.array([getattr(note, "pitch", 0) for note in notes], dtype="<i2")
+
+    voices = []
+    note_start = 0
+    for voice in project.voices:
+        voices.append(
+            {
+                "preset": voice.preset,
+                "bank": voice.bank,
+                "pitched": voice.pitched,
+                "repeat_length": voice.repeat_length,
+                "amplitude": voice.amplitude,
+                "pan": voice.pan,
+                "mute": voice.mute,
+                "solo": voice.solo,
+                "editor": voice.editor,
+                "note_start": note_start,
+                "note_count": len(voice.notes),
+            }
+        )
+        note_start += len(voice.notes)
+
+    header = json.dumps(
+        {
+            "version": VERSION,
+            "bpm": project.bpm,
+            "note_count": len(notes),
+            "voices": voices,
+        }
+    ).encode()
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(times.tobytes())
+        f.write(lengths.tobytes())
+        f.write(pitches.tobytes())
+
+
+def load(path: str) -> Project:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a Serpent project")
+    offset = len(MAGIC)
+    (header_length,) = HEADER_LENGTH.unpack_from(data, offset)
+    offset += HEADER_LENGTH.size
+    header = json.loads(data[offset : offset + header_length])
+    offset += header_length
+    if header["version"] > VERSION:
+        raise ValueError(f"{path} was saved by a newer version of Serpent")
+
+    count = header["note_count"]
+    times = np.frombuffer(data, dtype="<f8", count=count, offset=offset)
+    offset += times.nbytes
+    lengths = np.frombuffer(data, dtype="<f8", count=count, offset=offset)
+    offset += lengths.nbytes
+    pitches = np.frombuffer(data, dtype="<i2", count=count, offset=offset)
+
+    # plain floats and ints are much faster to build notes from
+    times, lengths, pitches = times.tolist(), lengths.tolist(), pitches.tolist()
+
+    voices = []
+    for voice in header["voices"]:
+        span = slice(voice["note_start"], voice["note_start"] + voice["note_count"])
+        if voice["pitched"]:
+            notes = [
+                audio.PitchedNote(time, length, pitch)
+                for time, length, pitch in zip(
+                    times[span], lengths[span], pitches[span]
+                )
+            ]
+        else:
+            notes = [
+                audio.Note(time, length)
+                for time, length in zip(times[span], lengths[span])
+            ]
+        voices.append(
+            VoiceRecord(
+                preset=voice["preset"],
+                notes=notes,
+                repeat_length=voice["repeat_length"],
+                amplitude=voice["amplitude"],
+                # not in files saved before the mixer existed
+                pan=voice.get("pan", 0),
+                mute=voice.get("mute", False),
+                solo=voice.get("solo", False),
+                pitched=voice["pitched"],
+                bank=voice["bank"],
+                editor=voice["editor"],
+            )
+        )
+    return Project(bpm=header["bpm"], voices=voices)
@@ -0,0 +1,239 @@
+"""Checks faster rendering against the reference: voices rendered
+sample by sample with get_sample_at_index, the plain code every
+vectorized, compiled or frozen path has to match.
+
+Scenes of SyncedVoices are rendered both ways and compared, each
+time from the same seed, so round robin voices choose the same
+samples. Frozen voices are played from float32 loops, so renders
+may differ by up to TOLERANCE, still far below what 16 bit audio
+can tell apart.
+
+Scenes in GOLDEN are also kept as 16 bit WAV files in fixtures, to
+catch changes to the reference itself. Ones with samples aren't,
+as decoding depends on librosa's version, and neither are noisy
+ones, whose garbling depends on how pow() rounds, see kernels.
+
+    python reference.py           check everything
+    python reference.py --update  render the golden files anew"""
+
+import argparse
+import math
+import os
+import random
+import wave
+
+import numpy as np
+
+import audio
+import backends
+import effects
+import instruments
+import presets
+import render
+import settings
+
+SEED = 0
+SECONDS = 3
+TOLERANCE = 1e-6
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+class MismatchError(Exception):
+    pass
+
+
+def mixed(
+    voices: list[audio.Voice], bpm: float, partition_size: int = 512
+) -> audio.SyncedVoices:
+    """voices with a send, an insert and bus effects, like the backing
+    track. The reverb takes blocks of multiples of partition_size."""
+    synced_voices = audio.SyncedVoices(voices, bpm)
+    delay = audio.SendBus([effects.FeedbackDelay()], gain=0.5)
+    synced_voices.bus.sends.append(delay)
+    voices[0].channel.sends[delay] = 0.3
+    voices[-1].channel.effects.append(effects.Equalizer(high_gain=-3))
+    synced_voices.bus.effects += [
+        effects.ConvolutionReverb.synthetic(
+            length=0.5, mix=0.2, partition_size=partition_size
+        ),
+        effects.Limiter(),
+    ]
+    return synced_voices
+
+
+def synth_voices(bpm: float) -> list[audio.Voice]:
+    """Pitched voices whose notes are released before the loop ends"""
+    sources = [
+        instruments.Harmonics([1, 0.5, 0.25]),
+        instruments.Sine(amplitude=0.5),
+        instruments.Square(amplitude=0.3),
+        instruments.Saw(amplitude=0.3),
+    ]
+    voices = []
+    for i, source in enumerate(sources):
+        notes = [
+            audio.PitchedNote(0, 0.75, 57 + 3 * i),
+            audio.PitchedNote(1.25, 1.5, 60 + 4 * i),
+            audio.PitchedNote(3, 0.25, 64 + i),
+        ]
+        synth = audio.ADSR(source, release_len=0.1)
+        voices.append(audio.Voice(synth, notes, 4, bpm, pitched=True, pan=i / 4))
+    return voices
+
+
+def synths() -> audio.SyncedVoices:
+    """Synthesizers slowing down, so notes end at fractional samples"""
+    synced_voices = mixed(synth_voices(120), 120)
+    synced_voices.ramp_bpm(90, 4)
+    return synced_voices
+
+
+def frozen_synths(bpm: float) -> audio.SyncedVoices:
+    """Synthesizers played from FrozenLoops, frozen right away"""
+    synced_voices = mixed(synth_voices(bpm), bpm)
+    segment = synced_voices.tempo_map.constant_segment(0, math.inf)
+    for voice in synced_voices.voices:
+        voice.frozen = audio.FrozenLoop(voice, voice.notes, segment)
+        voice.freeze = True
+    return synced_voices
+
+
+def frozen() -> audio.SyncedVoices:
+    """At a whole number of samples per beat"""
+    return frozen_synths(120)
+
+
+def frozen_130() -> audio.SyncedVoices:
+    """At 20353.8 samples per beat, so loops take 13 cycles to
+    end on a whole sample"""
+    return frozen_synths(130)
+
+
+def frozen_97() -> audio.SyncedVoices:
+    """Where loops would take 97 cycles, longer than
+    settings.freeze_max_seconds, so voices stay live"""
+    return frozen_synths(97)
+
+
+def live_130() -> audio.SyncedVoices:
+    """Like frozen_130, rendered live"""
+    return mixed(synth_voices(130), 130)
+
+
+def drums() -> audio.SyncedVoices:
+    """Drums without noise"""
+    rhythm = [audio.Note(0, 0.5), audio.Note(1.5, 0.25), audio.Note(2, 1)]
+    voices = [
+        audio.Voice(audio.ADSR(instruments.BassDrum()), rhythm, 3, 130),
+        audio.Voice(
+            audio.ADSR(instruments.BassDrum(amplitude=0.5)), rhythm[1:], 2, 130
+        ),
+    ]
+    return mixed(voices, 130)
+
+
+def noisy_drums() -> audio.SyncedVoices:
+    """Drums garbling noise, which is only the same as the reference
+    as long as every backend uses the same pow(), see kernels"""
+    rhythm = [audio.Note(0, 0.5), audio.Note(1.5, 0.25), audio.Note(2, 1)]
+    voices = [
+        audio.Voice(audio.ADSR(drum()), rhythm, 3, 97)
+        for drum in (instruments.SnareDrum, instruments.HiHatDrum)
+    ]
+    return mixed(voices, 97)
+
+
+def round_robin() -> audio.SyncedVoices:
+    """Sampled voices choosing a sample for each note"""
+    voices = []
+    for i, bank in enumerate(("hihat", "snare", "tom")):
+        source = instruments.RoundRobin(presets.list_files(bank))
+        rhythm = [audio.Note(beat / 2, 0.25) for beat in range(i, 8, 2)]
+        voices.append(audio.Voice(audio.ADSR(source, release_len=0.5), rhythm, 4, 100))
+    synced_voices = mixed(voices, 100)
+    synced_voices.ramp_bpm(130, 6)
+    return synced_voices
+
+
+SCENES = [
+    synths,
+    frozen,
+    live_130,
+    frozen_130,
+    frozen_97,
+    drums,
+    noisy_drums,
+    round_robin,
+]
+GOLDEN = [synths, frozen, frozen_130]
+
+
+def render_scene(scene, reference=False, seconds=SECONDS) -> np.ndarray:
+    """Stereo frames of the scene, as played or as the reference"""
+    random.seed(SEED)
+    synced_voices = scene()
+    for voice in synced_voices.voices:
+        voice.reference = reference
+    return render.render(synced_voices, seconds)
+
+
+def compare(scene, seconds=SECONDS) -> float:
+    """Largest difference between scene as played and the reference"""
+    played = render_scene(scene, False, seconds)
+    return float(np.max(np.abs(played - render_scene(scene, True, seconds))))
+
+
+def golden_path(scene) -> str:
+    return os.path.join(FIXTURES_PATH, f"{scene.__name__}.wav")
+
+
+def read_golden(scene) -> np.ndarray:
+    """16 bit frames of the golden file, of shape (frames, 2)"""
+    with wave.open(golden_path(scene), "rb") as f:
+        frames = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2")
+        return frames.reshape(-1, f.getnchannels())
+
+
+def update_golden():
+    os.makedirs(FIXTURES_PATH, exist_ok=True)
+    for scene in GOLDEN:
+        render.write_wav(golden_path(scene), render_scene(scene, reference=True))
+
+
+def check(scene):
+    """Raise MismatchError if scene isn't played like the reference
+    or, if golden, like its golden file"""
+    difference = compare(scene)
+    if difference > TOLERANCE:
+        raise MismatchError(f"{scene.__name__} is {difference} from the reference")
+    if scene in GOLDEN:
+        played = backends.float_to_pcm16(render_scene(scene)).astype(np.int32)
+        # 16 bit rounding may go either way for what is within TOLERANCE
+        steps = np.max(np.abs(played - read_golden(scene)))
+        if steps > 1:
+            raise MismatchError(
+                f"{scene.__name__} is {steps} steps from its golden file"
+            )
+
+
+def check_all():
+    for scene in SCENES:
+        check(scene)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare with reference rendering")
+    parser.add_argument(
+        "--update", action="store_true", help="render the golden files anew"
+    )
+    args = parser.parse_args()
+    if args.update:
+        update_golden()
+        print(f"Rendered {len(GOLDEN)} golden files to {FIXTURES_PATH}")
+    else:
+        check_all()
+        print(f"Rendering matches the reference, at {settings.samplerate} Hz")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Rendering without a GUI or an audio device, for servers and CI.
+Nothing here imports wx or PyAudio."""
+
+import math
+import wave
+
+import numpy as np
+
+import audio
+import backends
+import effects
+import presets
+import project
+import settings
+
+
+def project_voices(loaded: project.Project) -> audio.SyncedVoices:
+    """Voices of a project, mixed like the backing track does"""
+    voices = []
+    for record in loaded.voices:
+        found = presets.voice_from_record(record)
+        if found is None:
+            print(f"Warning: voice {record.preset} not found, skipping")
+            continue
+        voices.append(found[0])
+    synced_voices = audio.SyncedVoices(voices, loaded.bpm)
+    synced_voices.bus.effects.append(effects.Limiter())
+    return synced_voices
+
+
+def render(
+    source: audio.Sampleable, seconds: float, chunksize=settings.chunksize
+) -> np.ndarray:
+    """seconds of source, as stereo frames of shape (frames, 2)"""
+    frames = math.ceil(seconds * source.samplerate)
+    blocks = []
+    rendered = 0
+    while rendered < frames:
+        source.begin_block(rendered / source.samplerate)
+        blocks.append(audio.as_stereo(source.next_block(chunksize)))
+        rendered += chunksize
+    return np.concatenate(blocks)[:frames]
+
+
+def render_file(
+    path: str, source: audio.Sampleable, seconds: float, chunksize=settings.chunksize
+):
+    """Write seconds of source to a 16 bit WAV file, rounded up to
+    whole blocks"""
+    player = audio.Player(
+        [source],
+        source.samplerate,
+        chunksize,
+        backend=backends.FileBackend(path),
+    )
+    player.render(seconds)
+    player.close()
+
+
+def write_wav(path: str, samples: np.ndarray, samplerate=settings.samplerate):
+    """Write stereo frames to a 16 bit WAV file"""
+    with wave.open(path, "wb") as f:
+        f.setnchannels(samples.shape[1])
+        f.setsampwidth(2)
+        f.setframerate(samplerate)
+        f.writeframes(backends.float_to_pcm16(samples).tobytes())
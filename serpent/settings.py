@@ -2,7 +2,18 @@ version = "0.9"
 
 samplerate = 44100
 chunksize = 4096
+# (smallest, first, largest) frames per buffer of Player streams
+latency_profiles = {
+    "interactive": (256, 512, 2048),  # about 10 ms, for notes played on click
+    "playback": (1024, 4096, 16384),
+}
 concert_a_freq = 440
 default_note = 81
 harmonics_lut_resolution = 400000
+sample_cache_dir = None  # memory map decoded samples from here, see instruments
+compact_samples = True  # store sample banks as int16, see instruments.Sample
+sample_trim_threshold = 10 ** (-70 / 20)  # tails quieter than -70 dBFS are cut
+jit_kernels = True  # compile per-sample kernels with Numba, if installed, see kernels
+freeze_cycles = 4  # at least, of round robin voices frozen by audio.FrozenLoop
+freeze_max_seconds = 30  # voices with longer audio.FrozenLoops are rendered live
 nvoices = 8
@@ -1,10 +1,20 @@
+import os
+import struct
+import tempfile
+import numpy as np
 import wx
 import time
 
 import main
+import midi
 import gui
+import allocations
 import audio
+import instruments
 import notes
+import project
+import reference
+import render
 import settings
 
 from gui_modules import backing_track
@@ -34,9 +44,183 @@ def gui_test():
 
 
 def audio_test():
-    pass
+    # raises if the audio thread would allocate for a block
+    allocations.check_all()
+    print("audio_test: blocks render without allocating")
+    # raises if rendering differs from the reference or the golden files
+    reference.check_all()
+    print("audio_test: rendering matches the reference")
+
+
+def note_index_test():
+    index = audio.NoteIndex([audio.Note(2, 1), audio.Note(0, 1), audio.Note(1, 0.5)])
+    assert [note.time for note in index] == [0, 1, 2]
+    assert index.find(2.5).time == 2
+    assert index.find(1.75) is None  # between notes
+    assert index.find(1) is None  # notes don't contain their start
+    assert [note.time for note in index.in_range(0.5, 2)] == [0, 1]
+
+    audio.AddNote(audio.Note(3, 1)).apply(index)
+    removed = audio.RemoveNote(1).apply(index)
+    assert [note.time for note in removed] == [1]
+    assert audio.RemoveNote(1).apply(index) == []  # nothing starts there anymore
+    moved = audio.MoveNote(3, audio.Note(1, 0.5)).apply(index)
+    assert [note.time for note in moved] == [3]
+    assert [note.time for note in index] == [0, 1, 2]
+
+    # edits that would overlap raise and leave the index as it was
+    for edit in (
+        audio.AddNote(audio.Note(0.5, 1)),
+        audio.MoveNote(1, audio.Note(1.5, 1)),
+    ):
+        try:
+            edit.apply(index)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"{type(edit).__name__} made notes overlap")
+        assert [note.time for note in index] == [0, 1, 2]
+    print("note_index_test: notes are edited in place")
+
+
+def project_test():
+    voices = [
+        project.VoiceRecord(
+            "Synthesizer 1",
+            [audio.PitchedNote(0, 1, 60), audio.PitchedNote(1.5, 0.25, 67)],
+            4,
+            0.8,
+            pan=-0.5,
+            solo=True,
+            pitched=True,
+            editor={"quantize": [1, 4]},
+        ),
+        project.VoiceRecord("Snare drum", [audio.Note(1, 0.5)], 2, 1, mute=True),
+        project.VoiceRecord("Hi-hat", [], 1, 0.5, bank="abc"),
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.serpent")
+        project.save(path, project.Project(97.5, voices))
+        loaded = project.load(path)
+    assert loaded.bpm == 97.5
+    assert len(loaded.voices) == len(voices)
+    for voice, original in zip(loaded.voices, voices):
+        for attribute in (
+            "preset",
+            "repeat_length",
+            "amplitude",
+            "pan",
+            "mute",
+            "solo",
+            "pitched",
+            "bank",
+            "editor",
+        ):
+            assert getattr(voice, attribute) == getattr(original, attribute), attribute
+        assert [(note.time, note.length) for note in voice.notes] == [
+            (note.time, note.length) for note in original.notes
+        ]
+        if voice.pitched:
+            assert [note.pitch for note in voice.notes] == [
+                note.pitch for note in original.notes
+            ]
+    print("project_test: projects load as saved")
+
+
+def midi_test():
+    melody = midi.Track(
+        "Melody",
+        [audio.PitchedNote(0, 1, 60), audio.PitchedNote(1.5, 0.5, 64)],
+        pitched=True,
+    )
+    snare = midi.Track("Snare drum", [audio.Note(1, 0.25), audio.Note(3, 0.25)], False)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "test.mid")
+        # the melody repeats to fill the snare's 4 beats
+        midi.write(path, [(melody, 2), (snare, 4)], 130)
+        bpm, tracks = midi.read(path)
+    assert abs(bpm - 130) < 0.01  # tempos are whole microseconds per beat
+    tracks = {track.name: track for track in tracks}
+    assert set(tracks) == {"Melody", "Snare drum"}
+    assert [
+        (note.time, note.length, note.pitch) for note in tracks["Melody"].notes
+    ] == [(0, 1, 60), (1.5, 0.5, 64), (2, 1, 60), (3.5, 0.5, 64)]
+    assert not tracks["Snare drum"].pitched
+    assert [(note.time, note.length) for note in tracks["Snare drum"].notes] == [
+        (1, 0.25),
+        (3, 0.25),
+    ]
+
+    # snare hits at beats 0 and 1, each written as an on and off at one tick
+    hits = b"".join(
+        midi._write_varlen(delta) + bytes((status, 38, velocity))
+        for delta, status, velocity in [
+            (0, 0x99, 100),
+            (0, 0x89, 0),
+            (midi.TICKS_PER_BEAT, 0x99, 100),
+            (0, 0x89, 0),
+        ]
+    )
+    header = b"MThd" + struct.pack(">IHHH", 6, 0, 1, midi.TICKS_PER_BEAT)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "hits.mid")
+        with open(path, "wb") as f:
+            f.write(header + midi._track_chunk(hits))
+        _, tracks = midi.read(path)
+        with open(path, "wb") as f:
+            f.write(header + midi._track_chunk(hits)[:-6])
+        try:
+            midi.read(path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("truncated MIDI files should not be read")
+    assert [track.name for track in tracks] == ["Snare drum"]
+    assert [note.time for note in tracks[0].notes] == [0, 1]
+    print("midi_test: MIDI files read back as written")
+
+
+def tempo_map_test():
+    tempo_map = audio.TempoMap(120, settings.samplerate)
+    assert tempo_map.beat_at(settings.samplerate) == 2
+    tempo_map.set_bpm(130, settings.samplerate)
+    tempo_map.ramp(90, 8, 3 * settings.samplerate)
+    for beat in (0, 1.5, 2, 3.25, 5, 9.5, 14, 20):
+        index = tempo_map.sample_at(beat)
+        assert abs(tempo_map.beat_at(index) - beat) < 1e-9, beat
+    # the ramp ends at 90 BPM, 8 beats after it starts
+    ramp_start = tempo_map.beat_at(3 * settings.samplerate)
+    assert abs(tempo_map.bpm_at(tempo_map.sample_at(ramp_start + 8)) - 90) < 1e-6
+    assert tempo_map.constant_segment(0, settings.samplerate / 2) is not None
+    assert tempo_map.constant_segment(0, 2 * settings.samplerate) is None
+
+    indices = np.arange(0, 6 * settings.samplerate, 7, dtype=np.float64)
+    beats, scratch = np.zeros(len(indices)), np.zeros(len(indices))
+    tempo_map.beats_into(indices, beats, scratch)
+    assert beats.tolist() == [tempo_map.beat_at(index) for index in indices.tolist()]
+    print("tempo_map_test: samples and beats convert both ways")
+
+
+def rewind_test():
+    synth = audio.ADSR(instruments.Sine(), release_len=0.1)
+    voice = audio.Voice(synth, [audio.PitchedNote(2, 1, 69)], 4, 120, pitched=True)
+    synced_voices = audio.SyncedVoices([voice], 120)
+    # stop in the middle of the note, which starts at 1 s
+    render.render(synced_voices, 1.375, settings.chunksize)
+    synced_voices.enabled = False
+    synced_voices.rewind()
+    synced_voices.enabled = True
+    # the note was left behind at the stop, not carried on from the start
+    assert np.max(np.abs(render.render(synced_voices, 0.9, settings.chunksize))) == 0
+    print("rewind_test: rewinding stops the notes that were playing")
 
 
 if __name__ == "__main__":
     print("test.py")
+    note_index_test()
+    project_test()
+    midi_test()
+    tempo_map_test()
+    rewind_test()
+    audio_test()
     gui_test()